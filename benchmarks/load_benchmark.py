@@ -0,0 +1,381 @@
+"""
+End-to-end HTTP load benchmark for the ocr, qwen and tee services.
+
+Starts the service with uvicorn against a local fake Ollama, drives each endpoint with
+synthetic ID card / selfie images at the given concurrency levels and reports throughput,
+p50/p95/p99 latency and the service's peak RSS per level.
+
+    python benchmarks/load_benchmark.py qwen --concurrency 1 4 16 --requests 64 \\
+        --ollama-latency 2.0 --output results/qwen.json
+
+Run it from an environment with the service's requirements installed. Pass --url to benchmark
+a service that is already running instead (peak RSS is then not measured). Synthetic images
+are made unique per request so the embedding and VLM caches are not hit; --reuse-images
+measures the cached path instead. The tee service enforces face detection, so give it real
+photos with --id-card / --selfie.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import httpx
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVICES = {
+    "ocr": ("ocr-version", ["face-recognition", "ocr-extract", "id-verify"]),
+    "qwen": ("qwen-version", ["face-recognition", "ai-extract", "id-verify"]),
+    "tee": ("tee", ["face-recognition"]),
+}
+
+# Canned extraction returned by the fake Ollama; valid against the qwen ID document schema
+FAKE_EXTRACTION = json.dumps({
+    "name": "Jane",
+    "surname": "Doe",
+    "id_number": "X1234567",
+    "date_of_birth": "01.02.1990",
+    "document_type": "national ID card",
+    "nationality": "CHE"
+})
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate after a fixed delay, streamed or not, and /api/tags"""
+    latency = 0.0
+    tokens = 20
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body: bytes, content_type: str = "application/json"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json(json.dumps({"models": [{"name": "qwen2.5vl:3b"}]}).encode())
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not request.get("prompt"):
+            # Model preload
+            self.send_json(json.dumps({"response": "", "done": True}).encode())
+            return
+        if not request.get("stream", True):
+            time.sleep(self.latency)
+            self.send_json(json.dumps({"response": FAKE_EXTRACTION, "done": True}).encode())
+            return
+        # Stream the extraction as NDJSON, spreading the latency across the tokens
+        size = max(1, len(FAKE_EXTRACTION) // self.tokens)
+        pieces = [FAKE_EXTRACTION[i:i + size] for i in range(0, len(FAKE_EXTRACTION), size)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            self.wfile.write((json.dumps({"response": piece, "done": False}) + "\n").encode())
+            self.wfile.flush()
+        self.wfile.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+
+def start_fake_ollama(port: int, latency: float) -> ThreadingHTTPServer:
+    FakeOllamaHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def synthetic_id_card(seed: int) -> np.ndarray:
+    """A card-sized image with a portrait block and a few lines of text"""
+    card = np.full((540, 856, 3), 235, dtype=np.uint8)
+    cv2.rectangle(card, (40, 120), (260, 420), (180, 160, 150), -1)
+    cv2.ellipse(card, (150, 250), (70, 90), 0, 0, 360, (150, 180, 210), -1)
+    cv2.circle(card, (125, 230), 8, (40, 40, 40), -1)
+    cv2.circle(card, (175, 230), 8, (40, 40, 40), -1)
+    cv2.ellipse(card, (150, 290), (30, 12), 0, 0, 180, (60, 60, 140), 3)
+    lines = ["IDENTITY CARD", "Surname: DOE", "Given names: JANE", "Date of birth: 01.02.1990",
+             "Nationality: CHE", f"Document no: X{seed:07d}"]
+    for i, line in enumerate(lines):
+        cv2.putText(card, line, (300, 80 + i * 60), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (20, 20, 20), 2)
+    return card
+
+def synthetic_selfie(seed: int) -> np.ndarray:
+    selfie = np.full((640, 480, 3), 200, dtype=np.uint8)
+    cv2.ellipse(selfie, (240, 300), (130, 170), 0, 0, 360, (150, 180, 210), -1)
+    cv2.circle(selfie, (195, 260), 14, (40, 40, 40), -1)
+    cv2.circle(selfie, (285, 260), 14, (40, 40, 40), -1)
+    cv2.ellipse(selfie, (240, 370), (55, 20), 0, 0, 180, (60, 60, 140), 5)
+    # A seed-dependent pixel keeps each selfie's bytes distinct
+    selfie[0, 0] = (seed % 256, (seed // 256) % 256, (seed // 65536) % 256)
+    return selfie
+
+def encode_jpeg(img: np.ndarray) -> bytes:
+    ok, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise RuntimeError("JPEG encoding failed")
+    return buffer.tobytes()
+
+class ImageSource:
+    """Yields (id_card, selfie) JPEG pairs: fixed files, one reused synthetic pair, or a fresh pair per request"""
+
+    def __init__(self, id_card_path=None, selfie_path=None, reuse: bool = False):
+        self.fixed_id_card = open(id_card_path, "rb").read() if id_card_path else None
+        self.fixed_selfie = open(selfie_path, "rb").read() if selfie_path else None
+        self.reuse = reuse
+        self.counter = 0
+
+    def pair(self):
+        seed = 0 if self.reuse else self.counter
+        self.counter += 1
+        id_card = self.fixed_id_card or encode_jpeg(synthetic_id_card(seed))
+        selfie = self.fixed_selfie or encode_jpeg(synthetic_selfie(seed))
+        return id_card, selfie
+
+def build_request(endpoint: str, images: ImageSource, batch_images: int):
+    """Multipart files for one request to an endpoint"""
+    if endpoint == "ocr-extract-batch":
+        return [("files", (f"id_card_{i}.jpg", images.pair()[0], "image/jpeg")) for i in range(batch_images)]
+    id_card, selfie = images.pair()
+    if endpoint == "face-recognition":
+        return {"img1": ("id_card.jpg", id_card, "image/jpeg"), "img2": ("selfie.jpg", selfie, "image/jpeg")}
+    if endpoint in ("ocr-extract", "ai-extract"):
+        return {"file": ("id_card.jpg", id_card, "image/jpeg")}
+    if endpoint == "id-verify":
+        return {"id_card": ("id_card.jpg", id_card, "image/jpeg"), "selfie": ("selfie.jpg", selfie, "image/jpeg")}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+def read_rss_bytes(pid: int) -> int:
+    """Resident set size of a process and its children, from /proc"""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+class RSSSampler:
+    """Polls the service's RSS in a background thread and keeps the peak"""
+
+    def __init__(self, pid, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        if self.pid:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, read_rss_bytes(self.pid))
+            self.stopped.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+def percentile(sorted_values, q: float):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total: int, images: ImageSource, batch_images: int, pid):
+    """Send `total` requests to one endpoint with `concurrency` requests in flight"""
+    # Encode every payload up front so image generation doesn't count towards latency
+    payloads = [build_request(endpoint, images, batch_images) for _ in range(total)]
+    latencies = []
+    statuses = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            files = payloads[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"/{endpoint}", files=files)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[status] = statuses.get(status, 0) + 1
+            if status.startswith("2"):
+                latencies.append(elapsed)
+
+    with RSSSampler(pid) as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - start
+
+    latencies.sort()
+    succeeded = len(latencies)
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": succeeded,
+        "statuses": statuses,
+        "wall_seconds": wall_seconds,
+        "throughput_rps": succeeded / wall_seconds if wall_seconds else 0.0,
+        # Comparable across /ocr-extract and /ocr-extract-batch
+        "throughput_images_per_second": succeeded * (batch_images if endpoint == "ocr-extract-batch" else 1) / wall_seconds if wall_seconds else 0.0,
+        "latency_seconds": {
+            "mean": statistics.fmean(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None
+        },
+        "peak_rss_bytes": rss.peak or None
+    }
+
+def start_service(service_dir: str, port: int, ollama_port: int, extra_env):
+    env = dict(os.environ, OLLAMA_BASE_URL=f"http://127.0.0.1:{ollama_port}", PYTHONUNBUFFERED="1")
+    env.update(extra_env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.join(REPO_ROOT, service_dir),
+        env=env
+    )
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode} before becoming ready")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1)
+    raise RuntimeError(f"Service not ready after {timeout:.0f}s")
+
+def print_summary(result):
+    latency = result["latency_seconds"]
+    fmt = lambda value: f"{value * 1000:8.1f}" if value is not None else "       -"
+    rss = f"{result['peak_rss_bytes'] / 2**20:7.1f}" if result["peak_rss_bytes"] else "      -"
+    print(
+        f"{result['endpoint']:>17} c={result['concurrency']:<3} ok={result['succeeded']:<4}/{result['requests']:<4} "
+        f"{result['throughput_rps']:7.2f} rps  p50{fmt(latency['p50'])}  p95{fmt(latency['p95'])}  "
+        f"p99{fmt(latency['p99'])} ms  rss{rss} MiB  {result['statuses']}"
+    )
+
+async def benchmark(args):
+    service_dir, default_endpoints = SERVICES[args.service]
+    endpoints = args.endpoints or default_endpoints
+    images = ImageSource(args.id_card, args.selfie, args.reuse_images)
+
+    fake_ollama = None
+    process = None
+    base_url = args.url
+    if not base_url:
+        fake_ollama = start_fake_ollama(args.ollama_port, args.ollama_latency)
+        extra_env = dict(item.split("=", 1) for item in args.env)
+        process = start_service(service_dir, args.port, args.ollama_port, extra_env)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    results = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_until_ready(client, args.startup_timeout, process)
+            for endpoint in endpoints:
+                # One warm-up request per endpoint so lazy initialisation isn't measured
+                await client.post(f"/{endpoint}", files=build_request(endpoint, images, args.batch_images))
+                for concurrency in args.concurrency:
+                    result = await run_level(client, endpoint, concurrency, args.requests, images, args.batch_images, process.pid if process else None)
+                    print_summary(result)
+                    results.append(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if fake_ollama is not None:
+            fake_ollama.shutdown()
+
+    return {
+        "service": args.service,
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+        "config": {
+            "url": args.url,
+            "ollama_latency_seconds": None if args.url else args.ollama_latency,
+            "requests_per_level": args.requests,
+            "concurrency": args.concurrency,
+            "reuse_images": args.reuse_images,
+            "batch_images": args.batch_images,
+            "real_images": bool(args.id_card or args.selfie),
+            "env": args.env
+        },
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end HTTP load benchmark for the KYC services")
+    parser.add_argument("service", choices=sorted(SERVICES))
+    parser.add_argument("--endpoints", nargs="+", help="Endpoints to drive, without the leading slash (default: all of the service's)")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--ollama-latency", type=float, default=1.0, help="Seconds the fake Ollama takes per generation")
+    parser.add_argument("--ollama-port", type=int, default=11534)
+    parser.add_argument("--port", type=int, default=8100, help="Port to start the service on")
+    parser.add_argument("--url", help="Benchmark an already-running service at this URL instead of starting one")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra environment for the service, e.g. ADMISSION_QUEUE_ID_VERIFY=64")
+    parser.add_argument("--id-card", help="Use this ID card image instead of synthetic ones")
+    parser.add_argument("--selfie", help="Use this selfie image instead of synthetic ones")
+    parser.add_argument("--batch-images", type=int, default=8, help="Images per /ocr-extract-batch request")
+    parser.add_argument("--reuse-images", action="store_true", help="Send the same synthetic pair every time to measure cache hits")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
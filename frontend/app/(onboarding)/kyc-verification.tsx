@@ -6,11 +6,21 @@ import AsyncStorage from '@react-native-async-storage/async-storage'
 import { Ionicons } from '@expo/vector-icons'
 import { LinearGradient } from 'expo-linear-gradient'
 
+interface IDDocument {
+  name: string | null;
+  surname: string | null;
+  id_number: string | null;
+  date_of_birth: string | null;
+  document_type: string | null;
+  nationality: string | null;
+}
+
 interface VerificationResult {
   verification_id: string;
   face_verified: boolean;
   face_confidence: number;
   extracted_info: string;
+  id_document?: IDDocument;
   status: string;
   message: string;
 }
@@ -63,7 +73,7 @@ const kycVerification = () => {
   const saveUserData = async (verificationResult: VerificationResult) => {
     try {
       // Extract user information from the verification result
-      const extractedData = parseExtractedInfo(verificationResult.extracted_info)
+      const extractedData = verificationResult.id_document || parseExtractedInfo(verificationResult.extracted_info)
       
       // Get name from extracted data
       const name = extractedData.Name || extractedData.name || extractedData.full_name || extractedData.firstName || 'User'
@@ -252,7 +262,7 @@ const kycVerification = () => {
               <View style={styles.extractedCard}>
                 <Text style={styles.cardTitle}>Extracted Information</Text>
                 {(() => {
-                  const extractedData = parseExtractedInfo(result.extracted_info)
+                  const extractedData = result.id_document || parseExtractedInfo(result.extracted_info)
                   
                   if (extractedData.rawText) {
                     return (
@@ -265,7 +275,7 @@ const kycVerification = () => {
                   
                   return (
                     <View style={styles.extractedDataContainer}>
-                      {Object.entries(extractedData).map(([key, value]) => (
+                      {Object.entries(extractedData).filter(([, value]) => value != null).map(([key, value]) => (
                         <View key={key} style={styles.extractedItem}>
                           <Text style={styles.extractedLabel}>{key}</Text>
                           <Text style={styles.extractedValue}>{String(value)}</Text>
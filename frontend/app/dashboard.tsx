@@ -9,11 +9,21 @@ import AsyncStorage from '@react-native-async-storage/async-storage'
 
 const { width, height } = Dimensions.get('window')
 
+interface IDDocument {
+  name: string | null;
+  surname: string | null;
+  id_number: string | null;
+  date_of_birth: string | null;
+  document_type: string | null;
+  nationality: string | null;
+}
+
 interface VerificationResult {
   verification_id: string;
   face_verified: boolean;
   face_confidence: number;
   extracted_info: string;
+  id_document?: IDDocument;
   status: string;
   message: string;
   timestamp: string;
@@ -85,6 +95,10 @@ const Dashboard = () => {
   }
 
   const getNameFromVerification = (verificationResult: VerificationResult | null) => {
+    if (verificationResult?.id_document) {
+      return verificationResult.id_document.name
+    }
+    
     if (verificationResult?.extracted_info) {
       console.log('Extracting name from:', verificationResult.extracted_info)
       
@@ -4,11 +4,21 @@ import { Ionicons } from '@expo/vector-icons'
 import { router } from 'expo-router'
 import AsyncStorage from '@react-native-async-storage/async-storage'
 
+interface IDDocument {
+  name: string | null;
+  surname: string | null;
+  id_number: string | null;
+  date_of_birth: string | null;
+  document_type: string | null;
+  nationality: string | null;
+}
+
 interface VerificationResult {
   verification_id: string;
   face_verified: boolean;
   face_confidence: number;
   extracted_info: string;
+  id_document?: IDDocument;
   status: string;
   message: string;
   timestamp: string;
@@ -78,6 +88,17 @@ const Profile = () => {
   }
 
   const getExtractedInfo = (verificationResult: VerificationResult | null): ExtractedInfo => {
+    const document = verificationResult?.id_document
+    if (document) {
+      return {
+        name: document.name,
+        surname: document.surname,
+        idNumber: document.id_number,
+        dateOfBirth: document.date_of_birth,
+        nationality: document.nationality,
+        documentType: document.document_type
+      }
+    }
     if (verificationResult?.extracted_info) {
       try {
         // Clean up markdown formatting if present
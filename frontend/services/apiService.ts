@@ -20,11 +20,21 @@ interface AIExtractionResult {
   status: string;
 }
 
+interface IDDocument {
+  name: string | null;
+  surname: string | null;
+  id_number: string | null;
+  date_of_birth: string | null;
+  document_type: string | null;
+  nationality: string | null;
+}
+
 interface IDVerificationResult {
   verification_id: string;
   face_verified: boolean;
   face_confidence: number;
   extracted_info: string;
+  id_document?: IDDocument;
   status: string;
   message: string;
 }
@@ -1,18 +1,364 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+import os
+import sys
+
+# Helpers shared by the services live in zkyc_common at the repo root; images copy it next to main.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# DeepFace looks for weights under $DEEPFACE_HOME/.deepface/weights, so point it
+# at the local weight bundle before the library is imported
+MODEL_WEIGHTS_DIR = os.getenv("MODEL_WEIGHTS_DIR")
+if MODEL_WEIGHTS_DIR:
+    os.environ.setdefault("DEEPFACE_HOME", MODEL_WEIGHTS_DIR)
+
 from deepface import DeepFace
 import easyocr
 import cv2
 import numpy as np
-import tempfile
-import os
 from pathlib import Path
 from datetime import datetime
-import json
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from zkyc_common.inference import EmbeddingBatcher, InferenceExecutor, run_stages
+from zkyc_common.cache import TTLCache
+from zkyc_common.weights import verify_weight_bundle, write_weight_manifest
+from zkyc_common.admission import AdmissionMiddleware, admission_limiter
+from zkyc_common.metrics import MODEL_LOAD_SECONDS, AdmissionCollector, MetricsMiddleware, observe_stage
+from zkyc_common.verification_log import VerificationLog, new_verification_id
+from deepface.commons.distance import findThreshold as find_threshold
+from deepface.commons import functions
+import asyncio
+import hashlib
+import time
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+# Inference executor configuration
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS)
+
+@observe_stage("decode")
+def decode_image(contents: bytes) -> np.ndarray:
+    """Decode encoded image bytes into a BGR array without touching the filesystem"""
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    return img
+
+async def read_upload_image(upload: UploadFile) -> np.ndarray:
+    """Read an uploaded image and decode it once, off the event loop"""
+    contents = await upload.read()
+    return await asyncio.to_thread(decode_image, contents)
+
+# Face model configuration
+FACE_MODEL = os.getenv("FACE_MODEL", "VGG-Face")
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv")
+FACE_DISTANCE_METRIC = os.getenv("FACE_DISTANCE_METRIC", "cosine")
+
+# Face embedding cache configuration
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "256"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
 
-app = FastAPI(title="ZKYC OCR Service", description="Face verification and OCR text extraction for KYC")
+# Face embeddings keyed by image content hash and face pipeline config
+embedding_cache = TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL)
+
+def embedding_cache_key(contents: bytes, enforce_detection: bool) -> str:
+    digest = hashlib.sha256(contents).hexdigest()
+    return f"{digest}:{FACE_MODEL}:{FACE_DETECTOR}:{enforce_detection}"
+
+def find_distance(a: np.ndarray, b: np.ndarray, metric: str) -> float:
+    """Distance between two embeddings using DeepFace's metric names"""
+    if metric == "cosine":
+        return float(1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    if metric == "euclidean":
+        return float(np.linalg.norm(a - b))
+    if metric == "euclidean_l2":
+        return float(np.linalg.norm(a / np.linalg.norm(a) - b / np.linalg.norm(b)))
+    raise ValueError(f"Unsupported distance metric: {metric}")
+
+@observe_stage("face_detection")
+def detect_faces(img: np.ndarray, enforce_detection: bool) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """Detect and align every face in an image, returning model-ready crops and their facial areas.
+    Mirrors the preprocessing DeepFace.represent applies before the forward pass."""
+    target_size = functions.find_target_size(model_name=FACE_MODEL)
+    img_objs = functions.extract_faces(
+        img=img,
+        target_size=target_size,
+        detector_backend=FACE_DETECTOR,
+        grayscale=False,
+        enforce_detection=enforce_detection,
+        align=True
+    )
+    return [
+        (functions.normalize_input(img=face, normalization="base")[0], region)
+        for face, region, _ in img_objs
+    ]
+
+@observe_stage("embedding")
+def embed_batch(faces: np.ndarray) -> np.ndarray:
+    """Run one forward pass of the face model over a stacked batch of crops"""
+    model = DeepFace.build_model(FACE_MODEL)
+    if "keras" in str(type(model)):
+        return model(faces, training=False).numpy()
+    return np.stack([model.predict(face[np.newaxis])[0] for face in faces])
+
+# Face embedding micro-batching configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+embedding_batcher = EmbeddingBatcher(embed_batch, inference_executor, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS)
+
+async def get_face_embeddings(
+    contents: bytes,
+    img: Optional[np.ndarray] = None,
+    enforce_detection: bool = False,
+    detected: Optional[List[Tuple[np.ndarray, Dict[str, Any]]]] = None,
+    faces: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """Return cached face embeddings for an image, computing them on a cache miss.
+    Faces already detected by the caller are embedded without detecting again, and embeddings
+    the caller already looked up in the cache are returned without a second lookup."""
+    if faces is not None:
+        return faces
+    key = embedding_cache_key(contents, enforce_detection)
+    faces = embedding_cache.get(key)
+    if faces is None:
+        if detected is None:
+            if img is None:
+                img = await asyncio.to_thread(decode_image, contents)
+            detected = await inference_executor.run(detect_faces, img, enforce_detection)
+        embeddings = await embedding_batcher.embed([face for face, _ in detected])
+        faces = [
+            {"embedding": np.asarray(embedding, dtype=np.float32), "facial_area": facial_area}
+            for embedding, (_, facial_area) in zip(embeddings, detected)
+        ]
+        embedding_cache.put(key, faces)
+    return faces
+
+async def verify_faces(
+    img1_bytes: bytes,
+    img2_bytes: bytes,
+    img1: Optional[np.ndarray] = None,
+    img2: Optional[np.ndarray] = None,
+    enforce_detection: bool = False,
+    detected1: Optional[List[Tuple[np.ndarray, Dict[str, Any]]]] = None,
+    faces1: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """Compare the closest pair of faces from two images, returning a DeepFace.verify-shaped result"""
+    faces1, faces2 = await asyncio.gather(
+        get_face_embeddings(img1_bytes, img1, enforce_detection, detected1, faces1),
+        get_face_embeddings(img2_bytes, img2, enforce_detection),
+    )
+    distance, face1, face2 = min(
+        ((find_distance(f1["embedding"], f2["embedding"], FACE_DISTANCE_METRIC), f1, f2) for f1 in faces1 for f2 in faces2),
+        key=lambda match: match[0]
+    )
+    threshold = float(find_threshold(FACE_MODEL, FACE_DISTANCE_METRIC))
+    return {
+        "verified": distance <= threshold,
+        "distance": distance,
+        "threshold": threshold,
+        "model": FACE_MODEL,
+        "detector_backend": FACE_DETECTOR,
+        "similarity_metric": FACE_DISTANCE_METRIC,
+        "facial_areas": {"img1": face1["facial_area"], "img2": face2["facial_area"]}
+    }
+
+# Portrait masking for ID card OCR: the detected face box, grown by OCR_PORTRAIT_PADDING on each
+# side, is blanked before OCR. Boxes covering more than half the card (DeepFace reports the whole
+# image when it finds no face) are left alone.
+OCR_MASK_PORTRAIT = os.getenv("OCR_MASK_PORTRAIT", "true").lower() == "true"
+OCR_PORTRAIT_PADDING = float(os.getenv("OCR_PORTRAIT_PADDING", "0.2"))
+
+class DocumentContext:
+    """
+    Per-request state for an ID card image, shared by the OCR and face stages: the image is
+    decoded once and its faces detected, or looked up in the embedding cache, once
+    """
+    
+    def __init__(self, contents: bytes, img: np.ndarray):
+        self.contents = contents
+        self.img = img
+        self.detected: Optional[List[Tuple[np.ndarray, Dict[str, Any]]]] = None
+        self.faces: Optional[List[Dict[str, Any]]] = None
+        self.face_boxes: List[Dict[str, Any]] = []
+    
+    @classmethod
+    async def load(cls, contents: bytes) -> "DocumentContext":
+        context = cls(contents, await asyncio.to_thread(decode_image, contents))
+        context.faces = embedding_cache.get(embedding_cache_key(contents, False))
+        if context.faces is not None:
+            # Embeddings are cached already; their facial areas are all the OCR stage needs
+            context.face_boxes = [face["facial_area"] for face in context.faces]
+        else:
+            context.detected = await inference_executor.run(detect_faces, context.img, False)
+            context.face_boxes = [facial_area for _, facial_area in context.detected]
+        return context
+    
+    def portrait_boxes(self) -> List[Tuple[int, int, int, int]]:
+        """Padded face boxes as (x1, y1, x2, y2), clipped to the image"""
+        height, width = self.img.shape[:2]
+        boxes = []
+        for area in self.face_boxes:
+            if area["w"] * area["h"] > 0.5 * width * height:
+                continue
+            pad_x, pad_y = int(area["w"] * OCR_PORTRAIT_PADDING), int(area["h"] * OCR_PORTRAIT_PADDING)
+            boxes.append((
+                max(0, area["x"] - pad_x),
+                max(0, area["y"] - pad_y),
+                min(width, area["x"] + area["w"] + pad_x),
+                min(height, area["y"] + area["h"] + pad_y)
+            ))
+        return boxes
+    
+    def ocr_image(self) -> np.ndarray:
+        """The image with the portrait blanked out, so the text detector skips it"""
+        boxes = self.portrait_boxes() if OCR_MASK_PORTRAIT else []
+        if not boxes:
+            return self.img
+        masked = self.img.copy()
+        fill = tuple(int(c) for c in cv2.mean(self.img)[:3])
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(masked, (x1, y1), (x2 - 1, y2 - 1), fill, -1)
+        return masked
+
+# Model warm-up state, reported by /ready
+model_status: Dict[str, Any] = {"ready": False, "error": None, "load_seconds": None}
+
+def require_models_ready():
+    """Reject inference requests until the startup warm-up has finished"""
+    if not model_status["ready"]:
+        detail = f"Model warm-up failed: {model_status['error']}" if model_status["error"] else "Models are still loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "10"})
+
+# EasyOCR reader, built during startup warm-up
+reader: Optional[easyocr.Reader] = None
+
+@observe_stage("ocr")
+def read_text(img: np.ndarray) -> List[Tuple[Any, str, float]]:
+    """Run EasyOCR over a decoded image"""
+    return reader.readtext(img)
+
+# Batched OCR configuration: images per readtext_batched call and per request
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "8"))
+OCR_BATCH_MAX_IMAGES = int(os.getenv("OCR_BATCH_MAX_IMAGES", "32"))
+
+@observe_stage("ocr")
+def read_text_batched(images: List[np.ndarray], batch_size: int) -> List[List[Tuple[Any, str, float]]]:
+    """
+    Run EasyOCR over many images, batch_size at a time. readtext_batched needs equally sized
+    images, so each batch is padded at the bottom and right to its largest image, which leaves
+    bbox coordinates unchanged; images are batched in size order to keep the padding small.
+    """
+    order = sorted(range(len(images)), key=lambda i: images[i].shape[0] * images[i].shape[1])
+    results: List[Optional[List[Tuple[Any, str, float]]]] = [None] * len(images)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        height = max(images[i].shape[0] for i in indices)
+        width = max(images[i].shape[1] for i in indices)
+        batch = [
+            cv2.copyMakeBorder(
+                images[i], 0, height - images[i].shape[0], 0, width - images[i].shape[1],
+                cv2.BORDER_CONSTANT, value=(255, 255, 255)
+            )
+            for i in indices
+        ]
+        for i, image_results in zip(indices, reader.readtext_batched(batch, batch_size=batch_size)):
+            results[i] = image_results
+    return results
+
+def format_ocr_results(results: List[Tuple[Any, str, float]]) -> Dict[str, Any]:
+    """Confidence-filtered text and bboxes, as returned by /ocr-extract"""
+    extracted_text = []
+    detailed_results = []
+    
+    for (bbox, text, confidence) in results:
+        if confidence > 0.5:  # Filter out low confidence results
+            extracted_text.append(text)
+            detailed_results.append({
+                "text": text,
+                "confidence": float(confidence),
+                "bbox": [[float(coord) for coord in point] for point in bbox]
+            })
+    
+    return {
+        "extracted_text": " ".join(extracted_text),
+        "text_blocks": len(extracted_text),
+        "detailed_results": detailed_results
+    }
+
+def warm_up_models(prepare: bool = False) -> None:
+    """Load the face model and detector and the OCR reader, then run one dummy inference through each"""
+    global reader
+    if MODEL_WEIGHTS_DIR and not prepare:
+        verify_weight_bundle(MODEL_WEIGHTS_DIR)
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    embed_batch(np.stack([face for face, _ in detect_faces(dummy, enforce_detection=False)]))
+    reader = easyocr.Reader(
+        ['en'],
+        model_storage_directory=os.path.join(MODEL_WEIGHTS_DIR, "easyocr") if MODEL_WEIGHTS_DIR else None,
+        download_enabled=prepare or not MODEL_WEIGHTS_DIR
+    )
+    reader.readtext(dummy)
+
+async def warm_up_in_background():
+    """Warm up the models without holding up server startup; /ready flips once done"""
+    start = time.monotonic()
+    try:
+        await inference_executor.run(warm_up_models)
+        model_status["load_seconds"] = time.monotonic() - start
+        MODEL_LOAD_SECONDS.set(model_status["load_seconds"])
+        model_status["ready"] = True
+        logger.info(f"Models ready in {model_status['load_seconds']:.1f}s")
+    except Exception as e:
+        model_status["error"] = str(e)
+        logger.error(f"Model warm-up failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the verification log and warm up the models on startup; flush the log and release the inference pool on shutdown"""
+    verification_log.open()
+    warm_up_task = asyncio.create_task(warm_up_in_background())
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        await asyncio.to_thread(verification_log.close)
+        inference_executor.shutdown()
+
+app = FastAPI(
+    title="ZKYC OCR Service",
+    description="Face verification and OCR text extraction for KYC",
+    lifespan=lifespan,
+)
+
+
+# Admission control: per-endpoint concurrency limits with a bounded wait queue, configured by
+# ADMISSION_CONCURRENCY_<ENDPOINT> / ADMISSION_QUEUE_<ENDPOINT> / ADMISSION_MAX_WAIT_<ENDPOINT>
+admission_limiters = {
+    "face_recognition": admission_limiter("face_recognition", 4, 8),
+    "ocr_extract": admission_limiter("ocr_extract", 2, 4),
+    "id_verify": admission_limiter("id_verify", 2, 4)
+}
+
+# Request paths guarded by each limiter
+ADMISSION_ROUTES = {
+    "/face-recognition": admission_limiters["face_recognition"],
+    "/ocr-extract": admission_limiters["ocr_extract"],
+    "/ocr-extract-batch": admission_limiters["ocr_extract"],
+    "/id-verify": admission_limiters["id_verify"]
+}
+
+REGISTRY.register(AdmissionCollector(admission_limiters))
+
+# Innermost of the two, so only admitted requests are measured
+app.add_middleware(MetricsMiddleware, paths=ADMISSION_ROUTES)
+app.add_middleware(AdmissionMiddleware, routes=ADMISSION_ROUTES)
 
 # Add CORS middleware
 app.add_middleware(
@@ -23,9 +369,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize EasyOCR reader
-reader = easyocr.Reader(['en'])
-
 # Create upload directory
 os.makedirs("uploads", exist_ok=True)
 
@@ -33,6 +376,29 @@ os.makedirs("uploads", exist_ok=True)
 async def root():
     return {"message": "ZKYC OCR Service is running", "version": "1.0", "features": ["face_verification", "ocr_extraction"]}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once startup model warm-up has finished, 503 before"""
+    if not model_status["ready"]:
+        return JSONResponse(status_code=503, content=model_status)
+    return model_status
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/inference-stats")
+async def inference_stats():
+    """Inference pool, admission limiter, embedding cache, embedding batcher and verification log counters"""
+    return {
+        "executor": inference_executor.stats(),
+        "admission": {name: limiter.stats() for name, limiter in admission_limiters.items()},
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "verification_log": verification_log.stats()
+    }
+
 @app.post("/face-recognition")
 async def face_recognition(
     img1: UploadFile = File(..., description="First image for comparison"),
@@ -41,34 +407,19 @@ async def face_recognition(
     """
     Compare two uploaded images to verify if they contain the same person using DeepFace
     """
+    require_models_ready()
+    
     # Check if files are images
     allowed_types = ["image/jpeg", "image/jpg", "image/png", "image/gif", "image/bmp"]
     if img1.content_type not in allowed_types or img2.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Only image files are allowed")
     
-    # Create temporary files to save uploaded images
-    temp_dir = tempfile.mkdtemp()
+    img1_bytes = await img1.read()
+    img2_bytes = await img2.read()
     
     try:
-        # Save first image
-        img1_path = os.path.join(temp_dir, f"img1_{img1.filename}")
-        with open(img1_path, "wb") as f:
-            content = await img1.read()
-            f.write(content)
-        
-        # Save second image
-        img2_path = os.path.join(temp_dir, f"img2_{img2.filename}")
-        with open(img2_path, "wb") as f:
-            content = await img2.read()
-            f.write(content)
-        
-        # Perform face verification
-        result = DeepFace.verify(img1_path=img1_path, img2_path=img2_path, enforce_detection=False)
-        
-        # Clean up temporary files
-        os.remove(img1_path)
-        os.remove(img2_path)
-        os.rmdir(temp_dir)
+        # Perform face verification on cached, content-addressed embeddings
+        result = await verify_faces(img1_bytes, img2_bytes, enforce_detection=False)
         
         return {
             "verified": result["verified"],
@@ -81,15 +432,9 @@ async def face_recognition(
             "message": "Same person" if result["verified"] else "Different people"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(img1_path):
-            os.remove(img1_path)
-        if os.path.exists(img2_path):
-            os.remove(img2_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"Face recognition error: {str(e)}")
 
 @app.post("/ocr-extract")
@@ -97,45 +442,70 @@ async def ocr_extract(file: UploadFile = File(...)):
     """
     Extract text from uploaded image using EasyOCR
     """
+    require_models_ready()
+    
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    # Read and decode image file
+    img = await read_upload_image(file)
+    
     try:
-        # Read image file
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
         # Perform OCR
-        results = reader.readtext(img)
-        
-        # Extract text with confidence filtering
-        extracted_text = []
-        detailed_results = []
-        
-        for (bbox, text, confidence) in results:
-            if confidence > 0.5:  # Filter out low confidence results
-                extracted_text.append(text)
-                detailed_results.append({
-                    "text": text,
-                    "confidence": float(confidence),
-                    "bbox": [[float(coord) for coord in point] for point in bbox]
-                })
+        results = await inference_executor.run(read_text, img)
         
         return {
             "filename": file.filename,
-            "extracted_text": " ".join(extracted_text),
-            "text_blocks": len(extracted_text),
-            "detailed_results": detailed_results,
+            **format_ocr_results(results),
+            "status": "success"
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR extraction error: {str(e)}")
+
+@app.post("/ocr-extract-batch")
+async def ocr_extract_batch(files: List[UploadFile] = File(...)):
+    """
+    Extract text from several uploaded images with batched EasyOCR inference.
+    Results are returned in upload order, in the same format as /ocr-extract.
+    """
+    require_models_ready()
+    
+    if len(files) > OCR_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {OCR_BATCH_MAX_IMAGES} images per request")
+    if not all(file.content_type.startswith("image/") for file in files):
+        raise HTTPException(status_code=400, detail="All files must be images")
+    
+    images = [await read_upload_image(file) for file in files]
+    
+    try:
+        results = await inference_executor.run(read_text_batched, images, OCR_BATCH_SIZE)
+        return {
+            "results": [
+                {"filename": file.filename, **format_ocr_results(image_results)}
+                for file, image_results in zip(files, results)
+            ],
+            "images": len(files),
             "status": "success"
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR extraction error: {str(e)}")
 
+# Verification log configuration. Records are batched into SQLite by a background writer,
+# zlib-compressed; VERIFICATION_LOG_RETENTION_DAYS > 0 prunes older records
+VERIFICATION_LOG_PATH = os.getenv("VERIFICATION_LOG_PATH", os.path.join("uploads", "verifications.sqlite3"))
+VERIFICATION_LOG_BATCH_SIZE = int(os.getenv("VERIFICATION_LOG_BATCH_SIZE", "64"))
+VERIFICATION_LOG_FLUSH_SECONDS = float(os.getenv("VERIFICATION_LOG_FLUSH_SECONDS", "0.5"))
+VERIFICATION_LOG_RETENTION_DAYS = float(os.getenv("VERIFICATION_LOG_RETENTION_DAYS", "0"))
+
+verification_log = VerificationLog(
+    VERIFICATION_LOG_PATH,
+    VERIFICATION_LOG_BATCH_SIZE,
+    VERIFICATION_LOG_FLUSH_SECONDS,
+    VERIFICATION_LOG_RETENTION_DAYS * 24 * 3600
+)
+
 @app.post("/id-verify")
 async def id_verify(
     id_card: UploadFile = File(..., description="ID card image"),
@@ -144,43 +514,44 @@ async def id_verify(
     """
     Complete KYC verification: Extract text from ID card and verify face against selfie
     """
+    require_models_ready()
+    
     if not id_card.content_type.startswith("image/") or not selfie.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Both files must be images")
     
-    temp_dir = tempfile.mkdtemp()
+    # Decode the ID card and detect its face once, for both OCR and face verification;
+    # its bytes also key the embedding cache
+    id_card_bytes = await id_card.read()
+    selfie_bytes = await selfie.read()
     
     try:
-        # Save uploaded images
-        id_card_path = os.path.join(temp_dir, f"id_card_{id_card.filename}")
-        selfie_path = os.path.join(temp_dir, f"selfie_{selfie.filename}")
-        
-        with open(id_card_path, "wb") as f:
-            content = await id_card.read()
-            f.write(content)
-        
-        with open(selfie_path, "wb") as f:
-            content = await selfie.read()
-            f.write(content)
-        
-        # 1. Extract text from ID card
-        id_contents = cv2.imread(id_card_path)
-        ocr_results = reader.readtext(id_contents)
+        id_card_context = await DocumentContext.load(id_card_bytes)
         
-        extracted_text = []
-        for (bbox, text, confidence) in ocr_results:
-            if confidence > 0.5:
-                extracted_text.append(text)
+        # 1. Extract text from ID card, with the portrait masked out
+        async def extract_id_text():
+            ocr_image = await asyncio.to_thread(id_card_context.ocr_image)
+            ocr_results = await inference_executor.run(read_text, ocr_image)
+            return [text for (bbox, text, confidence) in ocr_results if confidence > 0.5]
         
-        # 2. Verify face between ID card and selfie
-        face_result = DeepFace.verify(
-            img1_path=id_card_path, 
-            img2_path=selfie_path,
-            enforce_detection=False
+        # 2. Verify face between ID card and selfie, concurrently with OCR, reusing the detection
+        stages = await run_stages(
+            extracted_text=extract_id_text(),
+            face_result=verify_faces(
+                id_card_bytes,
+                selfie_bytes,
+                img1=id_card_context.img,
+                detected1=id_card_context.detected,
+                faces1=id_card_context.faces
+            ),
         )
+        extracted_text = stages["extracted_text"]
+        face_result = stages["face_result"]
         
         # 3. Save results with timestamp
+        verification_id = new_verification_id()
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         verification_data = {
+            "verification_id": verification_id,
             "timestamp": timestamp,
             "id_card_filename": id_card.filename,
             "selfie_filename": selfie.filename,
@@ -197,39 +568,45 @@ async def id_verify(
             }
         }
         
-        # Save verification log
-        log_filename = f"verification_{timestamp}.json"
-        log_path = os.path.join("uploads", log_filename)
-        with open(log_path, "w", encoding="utf-8") as f:
-            json.dump(verification_data, f, indent=2, ensure_ascii=False)
-        
-        # Clean up temporary files
-        os.remove(id_card_path)
-        os.remove(selfie_path)
-        os.rmdir(temp_dir)
+        # Save verification log; the write happens off the request path
+        verification_log.append(verification_id, verification_data)
         
         return {
-            "verification_id": timestamp,
+            "verification_id": verification_id,
             "face_verified": face_result["verified"],
             "face_confidence": 1.0 - face_result["distance"],
             "extracted_text": " ".join(extracted_text),
             "text_blocks_found": len(extracted_text),
-            "verification_log": log_filename,
+            "verification_log": f"/verifications/{verification_id}",
             "status": "success",
             "message": "KYC verification completed successfully"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(id_card_path):
-            os.remove(id_card_path)
-        if os.path.exists(selfie_path):
-            os.remove(selfie_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"KYC verification error: {str(e)}")
 
+@app.get("/verifications/{verification_id}")
+async def get_verification(verification_id: str):
+    """
+    Look up a logged verification record by its ID
+    """
+    record = await asyncio.to_thread(verification_log.get, verification_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Verification not found")
+    return record
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="ZKYC OCR Service")
+    parser.add_argument("--prepare-weights", action="store_true", help="Download model weights into MODEL_WEIGHTS_DIR and write its checksum manifest")
+    args = parser.parse_args()
+    if args.prepare_weights:
+        if not MODEL_WEIGHTS_DIR:
+            parser.error("MODEL_WEIGHTS_DIR must be set to prepare the weight bundle")
+        warm_up_models(prepare=True)
+        write_weight_manifest(MODEL_WEIGHTS_DIR)
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
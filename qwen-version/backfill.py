@@ -0,0 +1,256 @@
+"""
+Bulk KYC backfill: run the /id-verify pipeline over an archive of ID card / selfie pairs and
+append one JSON line per pair to an output file.
+
+    python backfill.py pairs/ --output results.jsonl --workers 4
+    python backfill.py pairs.tar.gz --output results.jsonl
+    python backfill.py manifest.ndjson --output results.jsonl
+
+Sources:
+- a directory with one sub-directory per pair, holding id_card.<ext> and selfie.<ext>
+- a tar archive (optionally compressed) laid out the same way, read as a stream
+- an NDJSON manifest of {"id": ..., "id_card": path, "selfie": path}, paths relative to the manifest
+
+Results are written in input order, so the output is always a prefix of the input: rerunning
+the same command after an interruption skips the pairs already in the output and carries on.
+A rerun whose source no longer lines up with the output (pairs added or removed) is refused.
+A pair that can't be read (missing image, bad manifest line) or verified is written with
+"status": "failed" and its error, and the run moves on to the next one.
+Only a window of pairs is held in memory at a time, whatever the size of the input.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tarfile
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+
+import main
+
+ROLES = ("id_card", "selfie")
+
+# (pair_id, id_card_bytes, selfie_bytes, error); the images are None when the pair couldn't be read
+Pair = Tuple[str, Optional[bytes], Optional[bytes], Optional[str]]
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def role_of(filename: str) -> Optional[str]:
+    stem = os.path.splitext(os.path.basename(filename))[0].lower()
+    return stem if stem in ROLES else None
+
+def missing_roles(images) -> str:
+    return f"Pair needs both an id_card and a selfie image; missing {', '.join(role for role in ROLES if role not in images)}"
+
+def iter_directory(source: str, skip: int) -> Iterator[Pair]:
+    for pair_id in sorted(entry.name for entry in os.scandir(source) if entry.is_dir())[skip:]:
+        pair_dir = os.path.join(source, pair_id)
+        try:
+            paths = {role_of(name): os.path.join(pair_dir, name) for name in os.listdir(pair_dir) if role_of(name)}
+            if len(paths) != len(ROLES):
+                yield pair_id, None, None, missing_roles(paths)
+                continue
+            yield pair_id, read_file(paths["id_card"]), read_file(paths["selfie"]), None
+        except OSError as e:
+            yield pair_id, None, None, str(e)
+
+def iter_tar(source: str, skip: int, max_open_pairs: int = 64) -> Iterator[Pair]:
+    """Stream pairs from a tar archive; a pair is yielded as soon as both of its images are read.
+    A pair whose other image doesn't turn up within `max_open_pairs` pairs, or at all, is failed."""
+    open_pairs: Dict[str, Dict[str, bytes]] = {}
+    failed = set()
+    emitted = 0
+
+    def emit(pair: Pair) -> Iterator[Pair]:
+        nonlocal emitted
+        emitted += 1
+        if emitted > skip:
+            yield pair
+
+    with tarfile.open(source, mode="r|*") as archive:
+        for member in archive:
+            role = role_of(member.name)
+            if not member.isfile() or role is None:
+                continue
+            pair_id = os.path.normpath(os.path.dirname(member.name))
+            if pair_id in failed:
+                continue
+            images = open_pairs.setdefault(pair_id, {})
+            images[role] = archive.extractfile(member).read()
+            if len(images) == len(ROLES):
+                del open_pairs[pair_id]
+                yield from emit((pair_id, images["id_card"], images["selfie"], None))
+            elif len(open_pairs) > max_open_pairs:
+                # Open pairs are kept in the order they were first seen
+                oldest = next(iter(open_pairs))
+                failed.add(oldest)
+                yield from emit((oldest, None, None, missing_roles(open_pairs.pop(oldest))))
+    for pair_id, images in open_pairs.items():
+        yield from emit((pair_id, None, None, missing_roles(images)))
+
+def iter_manifest(source: str, skip: int) -> Iterator[Pair]:
+    base_dir = os.path.dirname(os.path.abspath(source))
+    entries = 0
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            entries += 1
+            if entries <= skip:
+                continue
+            pair_id = str(line_number)
+            try:
+                entry = json.loads(line)
+                pair_id = str(entry.get("id", line_number))
+                yield pair_id, read_file(os.path.join(base_dir, entry["id_card"])), read_file(os.path.join(base_dir, entry["selfie"])), None
+            except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+                yield pair_id, None, None, f"Invalid manifest entry on line {line_number}: {type(e).__name__}: {e}"
+
+def iter_pairs(source: str, skip: int = 0) -> Iterator[Pair]:
+    """Pairs from a source in a stable order, starting after the first `skip`"""
+    if os.path.isdir(source):
+        return iter_directory(source, skip)
+    if source.endswith((".ndjson", ".jsonl")):
+        return iter_manifest(source, skip)
+    if tarfile.is_tarfile(source):
+        return iter_tar(source, skip)
+    raise ValueError(f"Unsupported source: {source}")
+
+def completed_count(output: str) -> int:
+    """Number of complete result lines in the output; a partly written last line is truncated"""
+    if not os.path.exists(output):
+        return 0
+    lines = 0
+    last_newline = 0
+    position = 0
+    with open(output, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if not chunk:
+                break
+            count = chunk.count(b"\n")
+            if count:
+                lines += count
+                last_newline = position + chunk.rindex(b"\n") + 1
+            position += len(chunk)
+    if last_newline != position:
+        with open(output, "r+b") as f:
+            f.truncate(last_newline)
+    return lines
+
+def last_pair_id(output: str) -> str:
+    """pair_id of the last line of an output that ends with a complete line"""
+    with open(output, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        # Read backwards until the last line is whole
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(1 << 16, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    return json.loads(tail.rstrip(b"\n").rsplit(b"\n", 1)[-1])["pair_id"]
+
+def resume_pairs(source: str, output: str) -> Tuple[int, Iterator[Pair]]:
+    """Number of pairs already in the output, and the source's pairs after them.
+    The output's last pair must be the source's pair at that position; otherwise pairs were added
+    to or removed from the source since the output was written, and new results would be written
+    against the wrong pairs."""
+    skip = completed_count(output)
+    if not skip:
+        return 0, iter_pairs(source)
+    pairs = iter_pairs(source, skip - 1)
+    pair = next(pairs, None)
+    written = last_pair_id(output)
+    if pair is None or pair[0] != written:
+        found = f"pair {pair[0]!r}" if pair else "no pair"
+        raise ValueError(
+            f"Can't resume: pair {skip} of {output} is {written!r} but {source} has {found} there. "
+            "The source changed since the output was written; use a new --output"
+        )
+    return skip, pairs
+
+async def verify_pair(index: int, pair: Pair, slots: asyncio.Semaphore) -> Dict[str, Any]:
+    pair_id, id_card_bytes, selfie_bytes, error = pair
+    record: Dict[str, Any] = {"index": index, "pair_id": pair_id}
+    if error is not None:
+        record["status"] = "failed"
+        record["error"] = error
+        return record
+    async with slots:
+        try:
+            record["result"] = await main.verify_in_memory(id_card_bytes, selfie_bytes)
+            record["status"] = "done"
+        except HTTPException as e:
+            record["status"] = "failed"
+            record["error"] = str(e.detail)
+        except Exception as e:
+            record["status"] = "failed"
+            record["error"] = str(e)
+    return record
+
+async def backfill(source: str, output: str, workers: int, window: int) -> Dict[str, int]:
+    skip, pairs = resume_pairs(source, output)
+    slots = asyncio.Semaphore(workers)
+    in_flight: deque = deque()
+    counts = {"skipped": skip, "done": 0, "failed": 0}
+
+    main.ollama_client = main.create_ollama_client()
+    # Results carry verification IDs, so their records go to the service's verification log
+    main.verification_log.open()
+    try:
+        await main.inference_executor.run(main.face_pipeline.warm_up)
+        started = time.monotonic()
+
+        with open(output, "a", encoding="utf-8") as out:
+            def write(record: Dict[str, Any]):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+                processed = counts["done"] + counts["failed"]
+                if processed % 100 == 0:
+                    rate = processed / (time.monotonic() - started)
+                    print(f"{skip + processed} pairs written ({rate:.1f}/s)", flush=True)
+
+            index = skip
+            while True:
+                # Reading the next pair is blocking file IO
+                pair = await asyncio.to_thread(next, pairs, None)
+                if pair is None:
+                    break
+                in_flight.append(asyncio.create_task(verify_pair(index, pair, slots)))
+                index += 1
+                # Write finished results in input order, holding at most `window` pairs
+                while in_flight and (len(in_flight) >= window or in_flight[0].done()):
+                    write(await in_flight.popleft())
+            while in_flight:
+                write(await in_flight.popleft())
+        return counts
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.to_thread(main.verification_log.close)
+        await main.ollama_client.aclose()
+        main.inference_executor.shutdown()
+
+def run():
+    parser = argparse.ArgumentParser(description="Bulk KYC backfill over ID card / selfie pairs")
+    parser.add_argument("source", help="Directory, tar archive or NDJSON manifest of pairs")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to; rerun with the same file to resume")
+    parser.add_argument("--workers", type=int, default=4, help="Pairs verified concurrently")
+    parser.add_argument("--window", type=int, help="Pairs held in memory at once (default: 4 x workers)")
+    args = parser.parse_args()
+
+    try:
+        counts = asyncio.run(backfill(args.source, args.output, args.workers, args.window or 4 * args.workers))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Backfill finished: {counts['done']} verified, {counts['failed']} failed, {counts['skipped']} already done")
+
+if __name__ == "__main__":
+    run()
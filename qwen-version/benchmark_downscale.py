@@ -0,0 +1,129 @@
+"""
+Measure the latency saved by downscaling and re-encoding images before they are sent to
+Ollama, against the extraction quality lost.
+
+    python benchmark_downscale.py ../img --profiles 0:0 1600:90 1280:85 1024:80 768:75
+
+Each profile is MAX_SIDE:JPEG_QUALITY, the same knobs as VLM_MAX_SIDE / VLM_JPEG_QUALITY;
+0:0 sends the original upload. The prompt and JSON schema default to the ones /ai-extract and
+/id-verify use. Quality is the text similarity of each profile's output to the output for the
+original image, or to <image>.txt ground truth when that file exists. Latency includes the time
+spent preparing the image, for every profile.
+"""
+import argparse
+import difflib
+import json
+import os
+import statistics
+import time
+
+import httpx
+
+from main import (
+    ID_DOCUMENT_SCHEMA,
+    ID_EXTRACTION_PROMPT,
+    OLLAMA_BASE_URL,
+    QWEN_MODEL,
+    apply_response_format,
+    encode_image_to_base64,
+    prepare_image_for_vlm
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def parse_profile(value: str):
+    max_side, quality = value.split(":")
+    return int(max_side), int(quality)
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a.strip(), b.strip()).ratio()
+
+def generate(client: httpx.Client, image_bytes: bytes, prompt: str, schema: bool) -> str:
+    payload = {
+        "model": QWEN_MODEL,
+        "prompt": prompt,
+        "images": [encode_image_to_base64(image_bytes)],
+        "stream": False
+    }
+    if schema:
+        apply_response_format(payload, ID_DOCUMENT_SCHEMA)
+    # Fixed sampling so differences come from the image, not the decoder
+    payload["options"] = {"temperature": 0, "seed": 0}
+    response = client.post("/api/generate", json=payload)
+    response.raise_for_status()
+    return response.json().get("response", "")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VLM image downscaling profiles")
+    parser.add_argument("samples", help="Directory of sample ID images")
+    parser.add_argument("--profiles", nargs="+", type=parse_profile, default=[(0, 0), (1600, 90), (1280, 85), (1024, 80), (768, 75)])
+    parser.add_argument("--prompt", default=ID_EXTRACTION_PROMPT)
+    parser.add_argument("--no-schema", action="store_true", help="Don't constrain the output to the ID document JSON schema")
+    parser.add_argument("--repeats", type=int, default=1, help="Timed runs per image and profile")
+    parser.add_argument("--ollama-url", default=OLLAMA_BASE_URL)
+    parser.add_argument("--output", help="Write the full results as JSON to this path")
+    args = parser.parse_args()
+
+    images = sorted(f for f in os.listdir(args.samples) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if not images:
+        parser.error(f"No images found in {args.samples}")
+    if (0, 0) not in args.profiles:
+        args.profiles.insert(0, (0, 0))
+
+    results = {f"{max_side}:{quality}": [] for max_side, quality in args.profiles}
+    with httpx.Client(base_url=args.ollama_url, timeout=300) as client:
+        for name in images:
+            with open(os.path.join(args.samples, name), "rb") as f:
+                original = f.read()
+            truth_path = os.path.splitext(os.path.join(args.samples, name))[0] + ".txt"
+            truth = open(truth_path, encoding="utf-8").read() if os.path.exists(truth_path) else None
+            baseline_text = None
+            for max_side, quality in args.profiles:
+                start = time.perf_counter()
+                prepared = prepare_image_for_vlm(original, max_side, quality)
+                prepare_seconds = time.perf_counter() - start
+                latencies = []
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    text = generate(client, prepared, args.prompt, not args.no_schema)
+                    latencies.append(time.perf_counter() - start)
+                if (max_side, quality) == (0, 0):
+                    baseline_text = text
+                reference = truth if truth is not None else baseline_text
+                results[f"{max_side}:{quality}"].append({
+                    "image": name,
+                    "payload_bytes": len(prepared),
+                    "prepare_seconds": prepare_seconds,
+                    "latency_seconds": statistics.median(latencies),
+                    "similarity": similarity(text, reference),
+                    "reference": "ground_truth" if truth is not None else "original",
+                    "output": text
+                })
+                print(f"{name} {max_side}:{quality} {len(prepared) / 1024:.0f} KB {prepare_seconds + statistics.median(latencies):.2f}s")
+
+    def mean_latency(rows):
+        return statistics.mean(r["prepare_seconds"] + r["latency_seconds"] for r in rows)
+
+    baseline_latency = mean_latency(results["0:0"])
+    summary = []
+    for profile, rows in results.items():
+        latency = mean_latency(rows)
+        summary.append({
+            "profile": profile,
+            "mean_payload_kb": statistics.mean(r["payload_bytes"] for r in rows) / 1024,
+            "mean_latency_seconds": latency,
+            "latency_saved_pct": 100 * (baseline_latency - latency) / baseline_latency,
+            "mean_similarity": statistics.mean(r["similarity"] for r in rows)
+        })
+
+    print(f"\n{'profile':>10} {'payload KB':>11} {'latency s':>10} {'saved %':>8} {'similarity':>11}")
+    for row in summary:
+        print(f"{row['profile']:>10} {row['mean_payload_kb']:>11.0f} {row['mean_latency_seconds']:>10.2f} "
+              f"{row['latency_saved_pct']:>8.1f} {row['mean_similarity']:>11.3f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": QWEN_MODEL, "summary": summary, "results": results}, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,126 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from deepface import DeepFace
-import requests
+import os
+import sys
+
+# Helpers shared by the services live in zkyc_common at the repo root; images copy it next to main.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# DeepFace looks for weights under $DEEPFACE_HOME/.deepface/weights, so point it
+# at the local weight bundle before the library is imported
+MODEL_WEIGHTS_DIR = os.getenv("MODEL_WEIGHTS_DIR")
+if MODEL_WEIGHTS_DIR:
+    os.environ.setdefault("DEEPFACE_HOME", MODEL_WEIGHTS_DIR)
+
+from contextlib import asynccontextmanager
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from zkyc_common.inference import InferenceExecutor, run_stages
+from zkyc_common.cache import TTLCache
+from zkyc_common.faces import FacePipeline
+from zkyc_common.weights import write_weight_manifest
+from zkyc_common.admission import AdmissionMiddleware, admission_limiter
+from zkyc_common.metrics import AdmissionCollector, MetricsMiddleware, observe_stage
+from zkyc_common.verification_log import VerificationLog, new_verification_id
+import asyncio
+import threading
+import sqlite3
+import uuid
+import hashlib
+import time
+import logging
+import httpx
 import json
 import base64
-import tempfile
-import os
+import binascii
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import cv2
 import numpy as np
 
-app = FastAPI(title="ZKYC Qwen Service", description="Face verification and AI-powered text extraction for KYC")
+# Ollama configuration
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+QWEN_MODEL = "qwen2.5vl:3b"
+
+# Ollama client pool configuration
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "10"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+
+logger = logging.getLogger("uvicorn.error")
+
+# Inference executor configuration
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS)
+
+# Shared Ollama client, created on startup and reused by every request
+ollama_client: Optional[httpx.AsyncClient] = None
+
+def create_ollama_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=OLLAMA_BASE_URL,
+        timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the pooled Ollama client and verification log, start model warm-up and the job workers; release all on shutdown"""
+    global ollama_client
+    ollama_client = create_ollama_client()
+    warm_up_task = asyncio.create_task(warm_up_in_background())
+    verification_log.open()
+    job_workers = await start_job_workers()
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        await stop_job_workers(job_workers)
+        await asyncio.to_thread(verification_log.close)
+        await ollama_client.aclose()
+        ollama_client = None
+        inference_executor.shutdown()
+
+app = FastAPI(
+    title="ZKYC Qwen Service",
+    description="Face verification and AI-powered text extraction for KYC",
+    lifespan=lifespan,
+)
+
+
+# Admission control: per-endpoint concurrency limits with a bounded wait queue, configured by
+# ADMISSION_CONCURRENCY_<ENDPOINT> / ADMISSION_QUEUE_<ENDPOINT> / ADMISSION_MAX_WAIT_<ENDPOINT>
+admission_limiters = {
+    "face_recognition": admission_limiter("face_recognition", 4, 8),
+    "ai_extract": admission_limiter("ai_extract", 4, 8),
+    "id_verify": admission_limiter("id_verify", 2, 4)
+}
+
+# Request paths guarded by each limiter
+ADMISSION_ROUTES = {
+    "/face-recognition": admission_limiters["face_recognition"],
+    "/ai-extract": admission_limiters["ai_extract"],
+    "/ai-extract/stream": admission_limiters["ai_extract"],
+    "/id-verify": admission_limiters["id_verify"],
+    "/id-verify/stream": admission_limiters["id_verify"],
+    "/id-verify-base64": admission_limiters["id_verify"],
+    "/id-verify-binary": admission_limiters["id_verify"]
+}
+
+REGISTRY.register(AdmissionCollector(admission_limiters))
+
+# Innermost of the two, so only admitted requests are measured
+app.add_middleware(MetricsMiddleware, paths=ADMISSION_ROUTES)
+app.add_middleware(AdmissionMiddleware, routes=ADMISSION_ROUTES)
 
 # Add CORS middleware
 app.add_middleware(
@@ -24,25 +131,280 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Ollama configuration
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-QWEN_MODEL = "qwen2.5vl:3b"
-
 # Create upload directory
 current_dir = os.path.dirname(os.path.abspath(__file__))
 uploads_dir = os.path.join(current_dir, "uploads")
 os.makedirs(uploads_dir, exist_ok=True)
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Convert image to base64 string for Ollama"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def encode_image_to_base64(image_bytes: bytes) -> str:
+    """Convert image bytes to base64 string for Ollama"""
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+# VLM image preprocessing configuration. VLM_MAX_SIDE / VLM_JPEG_QUALITY set the defaults and
+# VLM_MAX_SIDE_<ENDPOINT> / VLM_JPEG_QUALITY_<ENDPOINT> override them per endpoint; 0 sends the upload as-is
+VLM_MAX_SIDE = int(os.getenv("VLM_MAX_SIDE", "1280"))
+VLM_JPEG_QUALITY = int(os.getenv("VLM_JPEG_QUALITY", "85"))
+
+VLM_IMAGE_PROFILES = {
+    endpoint: (
+        int(os.getenv(f"VLM_MAX_SIDE_{endpoint.upper()}", VLM_MAX_SIDE)),
+        int(os.getenv(f"VLM_JPEG_QUALITY_{endpoint.upper()}", VLM_JPEG_QUALITY))
+    )
+    for endpoint in ("ai_extract", "id_verify")
+}
+
+@observe_stage("vlm_image_prep")
+def prepare_image_for_vlm(image_bytes: bytes, max_side: int, jpeg_quality: int) -> bytes:
+    """Downscale so the longest side is at most max_side and re-encode as JPEG before sending to Ollama.
+    Formats OpenCV can't decode (GIF among them) are sent as uploaded, as before downscaling existed."""
+    if max_side <= 0:
+        return bytes(image_bytes)
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return bytes(image_bytes)
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        img = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        return bytes(image_bytes)
+    return encoded.tobytes()
+
+# Upload ingestion configuration
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+BASE64_BODY_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "object",
+                    "required": ["id_card_base64", "selfie_base64"],
+                    "properties": {
+                        "id_card_base64": {"type": "string", "format": "byte"},
+                        "selfie_base64": {"type": "string", "format": "byte"}
+                    }
+                }
+            }
+        }
+    }
+}
+
+class UploadTooLargeError(ValueError):
+    pass
+
+class StreamingBase64Fields:
+    """Incrementally decodes the base64 string fields of a flat JSON object as body chunks arrive.
+    Each wanted field is decoded straight into its own buffer and every other field is skipped,
+    so the base64 text and a parsed JSON copy are never held in memory. A wanted field given
+    twice is rejected rather than guessing which copy the client meant."""
+
+    def __init__(self, fields: Tuple[str, ...], max_bytes: int):
+        self.fields = {name: bytearray() for name in fields}
+        self.max_bytes = max_bytes
+        self._decoded = 0
+        self._state = "object"
+        self._key = bytearray()
+        self._key_escape = False
+        self._seen = set()
+        self._target: Optional[bytearray] = None
+        self._carry = b""
+        # Characters after a backslash in a value, until the escape is complete
+        self._escape: Optional[bytearray] = None
+
+    def feed(self, chunk: bytes):
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._state == "value":
+                i = self._feed_value(chunk, i, n)
+                continue
+            c = chunk[i:i + 1]
+            i += 1
+            if self._state == "key":
+                # Raw key text, escapes included; decoded once the key is complete
+                if c == b'"' and not self._key_escape:
+                    self._state = "colon"
+                else:
+                    self._key += c
+                    self._key_escape = c == b"\\" and not self._key_escape
+                continue
+            if c in b" \t\r\n":
+                continue
+            if self._state == "object":
+                self._expect(c, b"{", "key_or_end")
+            elif self._state == "key_or_end" and c == b"}":
+                self._state = "done"
+            elif self._state in ("key_or_end", "key_start"):
+                self._expect(c, b'"', "key")
+            elif self._state == "colon":
+                self._expect(c, b":", "value_start")
+            elif self._state == "value_start":
+                if c != b'"':
+                    raise ValueError("only string fields are supported")
+                name = json.loads(b'"' + bytes(self._key) + b'"')
+                self._target = self.fields.get(name)
+                if self._target is not None:
+                    if name in self._seen:
+                        raise ValueError(f"duplicate field {name!r}")
+                    self._seen.add(name)
+                self._key = bytearray()
+                self._state = "value"
+            elif self._state == "comma_or_end" and c == b",":
+                self._state = "key_start"
+            elif self._state == "comma_or_end" and c == b"}":
+                self._state = "done"
+            else:
+                raise ValueError(f"unexpected {c!r}")
+
+    def close(self):
+        if self._state != "done":
+            raise ValueError("truncated JSON body")
+
+    def _expect(self, c: bytes, expected: bytes, next_state: str):
+        if c != expected:
+            raise ValueError(f"expected {expected!r}, got {c!r}")
+        self._state = next_state
+
+    def _feed_value(self, chunk: bytes, i: int, n: int) -> int:
+        if self._escape is not None:
+            self._escape += chunk[i:i + 1]
+            if self._escape[:1] == b"u" and len(self._escape) < 5:
+                return i + 1
+            # Base64 text only needs escapes such as "\/" or "\u002f"; whitespace escapes such as "\n" are dropped
+            char = json.loads(b'"\\' + bytes(self._escape) + b'"')
+            if not char.isspace():
+                self._append(char.encode("utf-8"))
+            self._escape = None
+            return i + 1
+        quote = chunk.find(b'"', i)
+        stop = n if quote == -1 else quote
+        backslash = chunk.find(b"\\", i, stop)
+        if backslash != -1:
+            self._append(chunk[i:backslash])
+            self._escape = bytearray()
+            return backslash + 1
+        self._append(chunk[i:stop])
+        if quote == -1:
+            return n
+        if self._target is not None and self._carry:
+            self._write(binascii.a2b_base64(self._carry))
+        self._target = None
+        self._carry = b""
+        self._state = "comma_or_end"
+        return quote + 1
+
+    def _append(self, data: bytes):
+        if self._target is None or not data:
+            return
+        data = self._carry + data
+        usable = len(data) - len(data) % 4
+        self._carry = data[usable:]
+        if usable:
+            self._write(binascii.a2b_base64(data[:usable]))
+
+    def _write(self, decoded: bytes):
+        self._decoded += len(decoded)
+        if self._decoded > self.max_bytes:
+            raise UploadTooLargeError(f"Decoded images exceed {self.max_bytes} bytes")
+        self._target += decoded
+
+# Face model configuration
+FACE_MODEL = os.getenv("FACE_MODEL", "VGG-Face")
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv")
+FACE_DISTANCE_METRIC = os.getenv("FACE_DISTANCE_METRIC", "cosine")
+
+# Face embedding cache configuration
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "256"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+
+# Face embedding micro-batching configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+face_pipeline = FacePipeline(
+    FACE_MODEL,
+    FACE_DETECTOR,
+    FACE_DISTANCE_METRIC,
+    inference_executor,
+    TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL),
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    MODEL_WEIGHTS_DIR
+)
+
+async def warm_up_in_background():
+    """Warm up the face models, then have Ollama load Qwen, without holding up server startup"""
+    await face_pipeline.warm_up_in_background()
+
+    try:
+        # An empty prompt makes Ollama load the model into memory ahead of the first request
+        await ollama_client.post("/api/generate", json={"model": QWEN_MODEL, "prompt": ""})
+    except Exception as e:
+        logger.warning(f"Ollama model preload failed: {str(e)}")
+
+# Structured ID extraction: Ollama constrains generation to this JSON schema
+ID_DOCUMENT_FIELDS = ("name", "surname", "id_number", "date_of_birth", "document_type", "nationality")
+
+ID_DOCUMENT_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string"} for field in ID_DOCUMENT_FIELDS},
+    "required": list(ID_DOCUMENT_FIELDS)
+}
+
+ID_EXTRACTION_PROMPT = """
+Extract the identity fields from this ID document as JSON with these keys:
+- name: given name(s)
+- surname: family name
+- id_number: document or personal ID number
+- date_of_birth: date of birth as printed
+- document_type: e.g. passport, national ID card, driving licence
+- nationality: nationality as printed
+
+Use an empty string for any field that is not clearly printed on the document.
+Not all dates are the date of birth. Don't assume or deduce values.
+"""
+
+def apply_response_format(payload: Dict[str, Any], response_format: Dict[str, Any]):
+    """Constrain an Ollama generate payload to a JSON schema, decoding greedily"""
+    payload["format"] = response_format
+    payload["options"] = {"temperature": 0}
 
-def query_qwen_vision(image_path: str, prompt: str) -> str:
-    """Query Qwen2.5 VLM via Ollama"""
+def parse_id_document(text: str) -> Dict[str, Optional[str]]:
+    """Parse and validate a schema-constrained ID extraction; empty fields become None"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"ID extraction is not valid JSON: {str(e)}")
+    if not isinstance(data, dict):
+        raise ValueError("ID extraction is not a JSON object")
+    document = {}
+    for field in ID_DOCUMENT_FIELDS:
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"ID extraction field '{field}' is not a string")
+        document[field] = value.strip() or None if value else None
+    return document
+
+def id_document_response(document: Dict[str, Optional[str]]) -> Dict[str, Any]:
+    """Response fields for an extracted ID document: `extracted_info` stays a JSON string, as clients
+    parse it that way, and `id_document` carries the same fields as an object"""
+    return {
+        "extracted_info": json.dumps(document, ensure_ascii=False),
+        "id_document": document
+    }
+
+async def request_qwen_vision(
+    image_bytes: bytes,
+    prompt: str,
+    timeout: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None
+) -> str:
+    """Query Qwen2.5 VLM via Ollama without blocking the event loop"""
     try:
         # Encode image
-        image_base64 = encode_image_to_base64(image_path)
+        image_base64 = encode_image_to_base64(image_bytes)
         
         # Prepare request
         payload = {
@@ -51,32 +413,223 @@ def query_qwen_vision(image_path: str, prompt: str) -> str:
             "images": [image_base64],
             "stream": False
         }
+        if response_format:
+            apply_response_format(payload, response_format)
         
-        # Make request to Ollama
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload,
-            timeout=60
-        )
+        # Make request to Ollama over the shared keep-alive pool
+        request_timeout = httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT
+        with observe_stage("ollama"):
+            response = await ollama_client.post("/api/generate", json=payload, timeout=request_timeout)
+            if response.status_code != 200:
+                raise Exception(f"Ollama request failed: {response.status_code} - {response.text}")
         
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("response", "")
-        else:
-            raise Exception(f"Ollama request failed: {response.status_code} - {response.text}")
+        result = response.json()
+        return result.get("response", "")
             
     except Exception as e:
         raise Exception(f"Error querying Qwen: {str(e)}")
 
+# VLM result cache configuration
+VLM_CACHE_SIZE = int(os.getenv("VLM_CACHE_SIZE", "512"))
+VLM_CACHE_TTL = float(os.getenv("VLM_CACHE_TTL", "3600"))
+
+class SingleFlightCache:
+    """TTL/LRU result cache where concurrent misses for the same key share one in-flight call"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.results = TTLCache(max_size, ttl)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def get_or_run(self, key: str, factory):
+        cached = self.results.get(key)
+        if cached is not None:
+            return cached
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._complete(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller going away does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """The in-flight call for key, if there is one, to await shielded"""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        return future
+
+    def register(self, key: str) -> asyncio.Future:
+        """Mark key in flight for a call made outside get_or_run, such as a streamed one. The caller
+        resolves the returned future; its result is cached and handed to everyone who joined."""
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._complete(key, done))
+        return future
+
+    def _complete(self, key: str, task: asyncio.Future):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.results.put(key, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.results.stats(), "in_flight": len(self._in_flight), "coalesced": self.coalesced}
+
+# Qwen results keyed by image content hash, prompt, model and image profile
+vlm_cache = SingleFlightCache(VLM_CACHE_SIZE, VLM_CACHE_TTL)
+
+def vlm_cache_key(image_bytes: bytes, prompt: str, max_side: int, jpeg_quality: int, response_format: Optional[Dict[str, Any]] = None) -> str:
+    image_digest = hashlib.sha256(image_bytes).hexdigest()
+    prompt_digest = hashlib.sha256((prompt + json.dumps(response_format, sort_keys=True)).encode("utf-8")).hexdigest()
+    return f"{image_digest}:{prompt_digest}:{QWEN_MODEL}:{max_side}:{jpeg_quality}"
+
+async def query_qwen_vision(
+    image_bytes: bytes,
+    prompt: str,
+    endpoint: str,
+    timeout: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    validate: Optional[Callable[[str], Any]] = None
+) -> str:
+    """Query Qwen2.5 VLM with the endpoint's image profile, serving repeats from the result cache
+    and sharing concurrent identical calls. Output rejected by validate is not cached."""
+    max_side, jpeg_quality = VLM_IMAGE_PROFILES[endpoint]
+
+    async def run():
+        prepared = await asyncio.to_thread(prepare_image_for_vlm, image_bytes, max_side, jpeg_quality)
+        text = await request_qwen_vision(prepared, prompt, timeout, response_format)
+        if validate:
+            validate(text)
+        return text
+
+    key = vlm_cache_key(image_bytes, prompt, max_side, jpeg_quality, response_format)
+    return await vlm_cache.get_or_run(key, run)
+
+async def extract_id_document(image_bytes: bytes, endpoint: str) -> Dict[str, Optional[str]]:
+    """Schema-constrained ID field extraction, parsed and validated"""
+    text = await query_qwen_vision(image_bytes, ID_EXTRACTION_PROMPT, endpoint, response_format=ID_DOCUMENT_SCHEMA, validate=parse_id_document)
+    return parse_id_document(text)
+
+async def stream_qwen_vision(
+    image_bytes: bytes,
+    prompt: str,
+    endpoint: str,
+    timeout: Optional[float] = None,
+    response_format: Optional[Dict[str, Any]] = None,
+    validate: Optional[Callable[[str], Any]] = None
+):
+    """Yield Qwen2.5 VLM tokens as Ollama generates them; the full text is stored in the result cache.
+    Identical calls already in flight are joined, and identical calls made while this one streams
+    join it; a joined call's text arrives as a single token."""
+    max_side, jpeg_quality = VLM_IMAGE_PROFILES[endpoint]
+    key = vlm_cache_key(image_bytes, prompt, max_side, jpeg_quality, response_format)
+    cached = vlm_cache.results.get(key)
+    if cached is not None:
+        yield cached
+        return
+    in_flight = vlm_cache.join(key)
+    if in_flight is not None:
+        yield await asyncio.shield(in_flight)
+        return
+    
+    # Identical calls made while this one streams wait for its text
+    result = vlm_cache.register(key)
+    try:
+        prepared = await asyncio.to_thread(prepare_image_for_vlm, image_bytes, max_side, jpeg_quality)
+        payload = {
+            "model": QWEN_MODEL,
+            "prompt": prompt,
+            "images": [encode_image_to_base64(prepared)],
+            "stream": True
+        }
+        if response_format:
+            apply_response_format(payload, response_format)
+        request_timeout = httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT
+        tokens = []
+        try:
+            with observe_stage("ollama"):
+                async with ollama_client.stream("POST", "/api/generate", json=payload, timeout=request_timeout) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        raise Exception(f"Ollama request failed: {response.status_code} - {body.decode('utf-8', 'replace')}")
+                    # Ollama streams one JSON object per line
+                    async for line in response.aiter_lines():
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get("error"):
+                            raise Exception(chunk["error"])
+                        token = chunk.get("response", "")
+                        if token:
+                            tokens.append(token)
+                            yield token
+                        if chunk.get("done"):
+                            break
+        except Exception as e:
+            raise Exception(f"Error querying Qwen: {str(e)}")
+        text = "".join(tokens)
+        if validate:
+            validate(text)
+        result.set_result(text)
+    except Exception as e:
+        result.set_exception(e)
+        raise
+    finally:
+        if not result.done():
+            # The client went away mid-stream, which ends the Ollama call too
+            result.set_exception(Exception("Error querying Qwen: the streaming request was abandoned"))
+
+# Server-Sent Events configuration
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "10"))
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def with_heartbeat(events, interval: float):
+    """Interleave SSE comment lines into quiet stretches so idle timeouts on the way don't cut the stream"""
+    iterator = events.__aiter__()
+    next_event = asyncio.ensure_future(iterator.__anext__())
+    try:
+        while True:
+            done, _ = await asyncio.wait({next_event}, timeout=interval)
+            if not done:
+                yield ": keep-alive\n\n"
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+            yield event
+            next_event = asyncio.ensure_future(iterator.__anext__())
+    finally:
+        if not next_event.done():
+            next_event.cancel()
+            await asyncio.gather(next_event, return_exceptions=True)
+        await iterator.aclose()
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(with_heartbeat(events, SSE_HEARTBEAT_SECONDS), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/")
 async def root():
     return {"message": "ZKYC Qwen Service is running", "version": "1.0", "features": ["face_verification", "ai_text_extraction"]}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once startup model warm-up has finished, 503 before"""
+    if not face_pipeline.status["ready"]:
+        return JSONResponse(status_code=503, content=face_pipeline.status)
+    return face_pipeline.status
+
 @app.get("/health")
 async def health_check():
     """Check if Ollama and Qwen model are available"""
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=10)
+        response = await ollama_client.get("/api/tags", timeout=OLLAMA_HEALTH_TIMEOUT)
         if response.status_code == 200:
             models = response.json().get("models", [])
             qwen_available = any(QWEN_MODEL in model.get("name", "") for model in models)
@@ -91,6 +644,24 @@ async def health_check():
     except Exception as e:
         return {"status": "unhealthy", "ollama_available": False, "error": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/inference-stats")
+async def inference_stats():
+    """Inference pool, admission limiter, embedding cache, embedding batcher, VLM cache, job queue and verification log counters"""
+    return {
+        "executor": inference_executor.stats(),
+        "admission": {name: limiter.stats() for name, limiter in admission_limiters.items()},
+        "embedding_cache": face_pipeline.cache.stats(),
+        "embedding_batcher": face_pipeline.batcher.stats(),
+        "vlm_cache": vlm_cache.stats(),
+        "jobs": await asyncio.to_thread(job_store.stats),
+        "verification_log": verification_log.stats()
+    }
+
 @app.post("/face-recognition")
 async def face_recognition(
     img1: UploadFile = File(..., description="First image for comparison"),
@@ -99,34 +670,19 @@ async def face_recognition(
     """
     Compare two uploaded images to verify if they contain the same person using DeepFace
     """
+    face_pipeline.require_ready()
+    
     # Check if files are images
     allowed_types = ["image/jpeg", "image/jpg", "image/png", "image/gif", "image/bmp"]
     if img1.content_type not in allowed_types or img2.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Only image files are allowed")
     
-    # Create temporary files to save uploaded images
-    temp_dir = tempfile.mkdtemp()
+    img1_bytes = await img1.read()
+    img2_bytes = await img2.read()
     
     try:
-        # Save first image
-        img1_path = os.path.join(temp_dir, f"img1_{img1.filename}")
-        with open(img1_path, "wb") as f:
-            content = await img1.read()
-            f.write(content)
-        
-        # Save second image
-        img2_path = os.path.join(temp_dir, f"img2_{img2.filename}")
-        with open(img2_path, "wb") as f:
-            content = await img2.read()
-            f.write(content)
-        
-        # Perform face verification
-        result = DeepFace.verify(img1_path=img1_path, img2_path=img2_path, enforce_detection=False)
-        
-        # Clean up temporary files
-        os.remove(img1_path)
-        os.remove(img2_path)
-        os.rmdir(temp_dir)
+        # Perform face verification on cached, content-addressed embeddings
+        result = await face_pipeline.verify_faces(img1_bytes, img2_bytes, enforce_detection=False)
         
         return {
             "verified": result["verified"],
@@ -139,15 +695,9 @@ async def face_recognition(
             "message": "Same person" if result["verified"] else "Different people"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(img1_path):
-            os.remove(img1_path)
-        if os.path.exists(img2_path):
-            os.remove(img2_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"Face recognition error: {str(e)}")
 
 @app.post("/ai-extract")
@@ -161,21 +711,12 @@ async def ai_extract(
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
     
-    temp_dir = tempfile.mkdtemp()
-    
     try:
-        # Save uploaded image
-        image_path = os.path.join(temp_dir, f"image_{file.filename}")
-        with open(image_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Read uploaded image into memory
+        content = await file.read()
         
         # Query Qwen model
-        extracted_text = query_qwen_vision(image_path, prompt)
-        
-        # Clean up
-        os.remove(image_path)
-        os.rmdir(temp_dir)
+        extracted_text = await query_qwen_vision(content, prompt, "ai_extract")
         
         return {
             "filename": file.filename,
@@ -185,15 +726,94 @@ async def ai_extract(
             "status": "success"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(image_path):
-            os.remove(image_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"AI extraction error: {str(e)}")
 
+@app.post("/ai-extract/stream")
+async def ai_extract_stream(
+    file: UploadFile = File(...),
+    prompt: str = "Extract all visible text from this image. Format the response as clear, structured text."
+):
+    """
+    /ai-extract relayed as Server-Sent Events: `token` events carry text as Qwen generates it,
+    then a `result` event carries the full /ai-extract response
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    
+    content = await file.read()
+    
+    async def events():
+        tokens = []
+        try:
+            async for token in stream_qwen_vision(content, prompt, "ai_extract"):
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
+            yield sse_event("result", {
+                "filename": file.filename,
+                "prompt_used": prompt,
+                "extracted_text": "".join(tokens),
+                "model": QWEN_MODEL,
+                "status": "success"
+            })
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield sse_event("error", {"detail": f"AI extraction error: {detail}"})
+    
+    return sse_response(events())
+
+# Verification log configuration. Records are batched into SQLite by a background writer,
+# zlib-compressed; VERIFICATION_LOG_RETENTION_DAYS > 0 prunes older records
+VERIFICATION_LOG_PATH = os.getenv("VERIFICATION_LOG_PATH", os.path.join(uploads_dir, "verifications.sqlite3"))
+VERIFICATION_LOG_BATCH_SIZE = int(os.getenv("VERIFICATION_LOG_BATCH_SIZE", "64"))
+VERIFICATION_LOG_FLUSH_SECONDS = float(os.getenv("VERIFICATION_LOG_FLUSH_SECONDS", "0.5"))
+VERIFICATION_LOG_RETENTION_DAYS = float(os.getenv("VERIFICATION_LOG_RETENTION_DAYS", "0"))
+
+verification_log = VerificationLog(
+    VERIFICATION_LOG_PATH,
+    VERIFICATION_LOG_BATCH_SIZE,
+    VERIFICATION_LOG_FLUSH_SECONDS,
+    VERIFICATION_LOG_RETENTION_DAYS * 24 * 3600
+)
+
+def finish_id_verification(id_card_filename: Optional[str], selfie_filename: Optional[str], extracted_info: Dict[str, Optional[str]], face_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue the verification log record and build the /id-verify response; uploads without a filename log None"""
+    verification_id = new_verification_id()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    verification_data = {
+        "verification_id": verification_id,
+        "timestamp": timestamp,
+        "id_card_filename": id_card_filename,
+        "selfie_filename": selfie_filename,
+        "ai_extraction": {
+            "extracted_info": extracted_info,
+            "model": QWEN_MODEL,
+            "method": "AI-powered vision"
+        },
+        "face_verification": {
+            "verified": face_result["verified"],
+            "distance": face_result["distance"],
+            "threshold": face_result["threshold"],
+            "model": face_result["model"]
+        }
+    }
+    
+    # Save verification log; the write happens off the request path
+    verification_log.append(verification_id, verification_data)
+    
+    return {
+        "verification_id": verification_id,
+        "face_verified": face_result["verified"],
+        "face_confidence": 1.0 - face_result["distance"],
+        **id_document_response(extracted_info),
+        "extraction_method": "AI-powered vision",
+        "verification_log": f"/verifications/{verification_id}",
+        "status": "success",
+        "message": "AI-powered KYC verification completed successfully"
+    }
+
 @app.post("/id-verify")
 async def id_verify(
     id_card: UploadFile = File(..., description="ID card image"),
@@ -202,179 +822,462 @@ async def id_verify(
     """
     Complete KYC verification: AI-powered ID text extraction + face verification
     """
+    face_pipeline.require_ready()
+    
     if not id_card.content_type.startswith("image/") or not selfie.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Both files must be images")
     
-    temp_dir = tempfile.mkdtemp()
+    # The ID card bytes feed Ollama and key the face embedding cache
+    id_card_bytes = await id_card.read()
+    selfie_bytes = await selfie.read()
     
     try:
-        # Save uploaded images
-        id_card_path = os.path.join(temp_dir, f"id_card_{id_card.filename}")
-        selfie_path = os.path.join(temp_dir, f"selfie_{selfie.filename}")
-        
-        with open(id_card_path, "wb") as f:
-            content = await id_card.read()
-            f.write(content)
-        
-        with open(selfie_path, "wb") as f:
-            content = await selfie.read()
-            f.write(content)
-        
-        # 1. AI-powered ID extraction
-        id_extraction_prompt = """
-        Extract key information from this ID document and output it as a JSON object.
-        The JSON should include fields for:
-        - Name
-        - Surname
-        - ID Number
-        - Date of Birth
-        - Document Type
-        - Nationality
-        - Any other important details found on the document.
-        
-        Your response must be only the JSON object.
-        """
-        
-        extracted_text = query_qwen_vision(id_card_path, id_extraction_prompt)
-        
-        # 2. Face verification
-        face_result = DeepFace.verify(
-            img1_path=id_card_path, 
-            img2_path=selfie_path,
-            enforce_detection=False
+        # 1. AI-powered ID extraction and 2. face verification, run concurrently
+        stages = await run_stages(
+            extracted_info=extract_id_document(id_card_bytes, "id_verify"),
+            face_result=face_pipeline.verify_faces(id_card_bytes, selfie_bytes),
         )
         
         # 3. Save results with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        verification_data = {
-            "timestamp": timestamp,
-            "id_card_filename": id_card.filename,
-            "selfie_filename": selfie.filename,
-            "ai_extraction": {
-                "extracted_info": extracted_text,
-                "model": QWEN_MODEL,
-                "method": "AI-powered vision"
-            },
-            "face_verification": {
-                "verified": face_result["verified"],
-                "distance": face_result["distance"],
-                "threshold": face_result["threshold"],
-                "model": face_result["model"]
-            }
-        }
-        
-        # Save verification log
-        log_filename = f"ai_verification_{timestamp}.json"
-        log_path = os.path.join(uploads_dir, log_filename)
-        with open(log_path, "w", encoding="utf-8") as f:
-            json.dump(verification_data, f, indent=2, ensure_ascii=False)
-        
-        # Clean up temporary files
-        os.remove(id_card_path)
-        os.remove(selfie_path)
-        os.rmdir(temp_dir)
-        
-        return {
-            "verification_id": timestamp,
-            "face_verified": face_result["verified"],
-            "face_confidence": 1.0 - face_result["distance"],
-            "extracted_info": extracted_text,
-            "extraction_method": "AI-powered vision",
-            "verification_log": log_filename,
-            "status": "success",
-            "message": "AI-powered KYC verification completed successfully"
-        }
+        return finish_id_verification(id_card.filename, selfie.filename, stages["extracted_info"], stages["face_result"])
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(id_card_path):
-            os.remove(id_card_path)
-        if os.path.exists(selfie_path):
-            os.remove(selfie_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"AI KYC verification error: {str(e)}")
 
-@app.post("/id-verify-base64")
-async def id_verify_base64(request: Dict[str, str]):
+@app.post("/id-verify/stream")
+async def id_verify_stream(
+    id_card: UploadFile = File(..., description="ID card image"),
+    selfie: UploadFile = File(..., description="Selfie image")
+):
     """
-    KYC verification using base64 encoded images (better for React Native)
+    /id-verify with the ID extraction relayed as Server-Sent Events: `token` events carry the
+    extraction as Qwen generates it, then a `result` event carries the full /id-verify response
+    """
+    face_pipeline.require_ready()
+    
+    if not id_card.content_type.startswith("image/") or not selfie.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Both files must be images")
+    
+    id_card_bytes = await id_card.read()
+    selfie_bytes = await selfie.read()
+    
+    async def events():
+        # Face matching runs while the extraction streams; if it fails, the extraction is cut short
+        # and the error sent right away, as run_stages does for /id-verify
+        face_task = asyncio.create_task(face_pipeline.verify_faces(id_card_bytes, selfie_bytes))
+        stream = stream_qwen_vision(id_card_bytes, ID_EXTRACTION_PROMPT, "id_verify", response_format=ID_DOCUMENT_SCHEMA, validate=parse_id_document)
+        next_token = asyncio.ensure_future(stream.__anext__())
+        tokens = []
+        try:
+            while True:
+                await asyncio.wait({next_token} if face_task.done() else {next_token, face_task}, return_when=asyncio.FIRST_COMPLETED)
+                if face_task.done():
+                    # Raises the face matching error, if any
+                    face_task.result()
+                if not next_token.done():
+                    continue
+                try:
+                    token = next_token.result()
+                except StopAsyncIteration:
+                    break
+                tokens.append(token)
+                yield sse_event("token", {"token": token})
+                next_token = asyncio.ensure_future(stream.__anext__())
+            extracted_info = parse_id_document("".join(tokens))
+            face_result = await face_task
+            yield sse_event("result", finish_id_verification(id_card.filename, selfie.filename, extracted_info, face_result))
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            yield sse_event("error", {"detail": f"AI KYC verification error: {detail}"})
+        finally:
+            face_task.cancel()
+            if not next_token.done():
+                next_token.cancel()
+                await asyncio.gather(next_token, return_exceptions=True)
+            await stream.aclose()
+    
+    return sse_response(events())
+
+@app.get("/verifications/{verification_id}")
+async def get_verification(verification_id: str):
+    """
+    Look up a logged verification record by its ID
+    """
+    record = await asyncio.to_thread(verification_log.get, verification_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Verification not found")
+    return record
+
+async def verify_in_memory(id_card_bytes: bytes, selfie_bytes: bytes) -> Dict[str, Any]:
+    """
+    Shared KYC pipeline for the streaming base64 and binary endpoints
     """
     try:
-        id_card_base64 = request.get("id_card_base64")
-        selfie_base64 = request.get("selfie_base64")
-        
-        if not id_card_base64 or not selfie_base64:
-            raise HTTPException(status_code=400, detail="Both id_card_base64 and selfie_base64 are required")
-        
-        temp_dir = tempfile.mkdtemp()
-        
-        # Decode base64 images and save to temp files
-        id_card_path = os.path.join(temp_dir, "id_card.jpg")
-        selfie_path = os.path.join(temp_dir, "selfie.jpg")
-        
-        with open(id_card_path, "wb") as f:
-            f.write(base64.b64decode(id_card_base64))
-        
-        with open(selfie_path, "wb") as f:
-            f.write(base64.b64decode(selfie_base64))
-        
-        # 1. AI-powered ID extraction
-        id_extraction_prompt = """
-        Extract key information from this ID document and output it as a JSON object.
-        The JSON should include fields like:
-        - Name
-        - Surname
-        - ID Number
-        - Date of Birth
-        - Document Type
-        - Nationality
-        - Any other important details found on the document.
-        
-        Your response must be only the JSON object. 
-        Not all dates are date of birth. 
-        If you are not sure about any field don't include it. Don't assume or deduce things.
-        """
-        
-        extracted_text = query_qwen_vision(id_card_path, id_extraction_prompt)
-        
-        # 2. Face verification
-        face_result = DeepFace.verify(
-            img1_path=id_card_path, 
-            img2_path=selfie_path,
-            enforce_detection=False
+        # 1. AI-powered ID extraction and 2. face verification, run concurrently
+        stages = await run_stages(
+            extracted_info=extract_id_document(id_card_bytes, "id_verify"),
+            face_result=face_pipeline.verify_faces(id_card_bytes, selfie_bytes),
         )
+        return finish_id_verification(None, None, stages["extracted_info"], stages["face_result"])
         
-        # 3. Save results with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Clean up temporary files
-        os.remove(id_card_path)
-        os.remove(selfie_path)
-        os.rmdir(temp_dir)
-        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"AI KYC verification error: {str(e)}")
+
+async def read_base64_images(request: Request) -> Tuple[bytearray, bytearray]:
+    """Decode id_card_base64 and selfie_base64 from a JSON body while it streams in"""
+    decoder = StreamingBase64Fields(("id_card_base64", "selfie_base64"), MAX_UPLOAD_BYTES)
+    try:
+        async for chunk in request.stream():
+            decoder.feed(chunk)
+        decoder.close()
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {str(e)}")
+    
+    id_card_bytes = decoder.fields["id_card_base64"]
+    selfie_bytes = decoder.fields["selfie_base64"]
+    if not id_card_bytes or not selfie_bytes:
+        raise HTTPException(status_code=400, detail="Both id_card_base64 and selfie_base64 are required")
+    return id_card_bytes, selfie_bytes
+
+@app.post("/id-verify-base64", openapi_extra=BASE64_BODY_SCHEMA)
+async def id_verify_base64(request: Request):
+    """
+    KYC verification using base64 encoded images (better for React Native).
+    The JSON body is decoded while it streams in, so only the decoded images are held in memory.
+    """
+    face_pipeline.require_ready()
+    
+    id_card_bytes, selfie_bytes = await read_base64_images(request)
+    return await verify_in_memory(id_card_bytes, selfie_bytes)
+
+@app.post("/id-verify-binary")
+async def id_verify_binary(
+    request: Request,
+    x_id_card_length: int = Header(..., description="Byte length of the ID card image at the start of the body")
+):
+    """
+    KYC verification from a raw application/octet-stream body: the ID card image bytes
+    immediately followed by the selfie image bytes, split at X-ID-Card-Length
+    """
+    face_pipeline.require_ready()
+    
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    
+    if not 0 < x_id_card_length < len(body):
+        raise HTTPException(status_code=400, detail="X-ID-Card-Length must split the body into two non-empty images")
+    
+    # Both images are zero-copy views into the single request buffer
+    view = memoryview(body)
+    return await verify_in_memory(view[:x_id_card_length], view[x_id_card_length:])
+
+# Asynchronous verification jobs: a SQLite-backed queue drained by local workers
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join(uploads_dir, "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_QUEUE_TIMEOUT = float(os.getenv("JOB_QUEUE_TIMEOUT", "3600"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+
+class JobQueueFull(Exception):
+    pass
+
+class JobStore:
+    """
+    Persistent job queue, shareable by several processes through one SQLite file. Input images
+    are kept until the job finishes. A claimed job is leased to its process for `lease_seconds`
+    and the lease is renewed while it runs; a job whose lease runs out (its process crashed or
+    restarted) is claimed again by any process, up to `max_attempts` claims. Jobs still queued
+    after `queue_timeout` seconds fail, so they never sit queued when no worker can run them.
+    """
+    
+    def __init__(self, path: str, max_attempts: int, lease_seconds: float, queue_timeout: float, max_queued: int):
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.queue_timeout = queue_timeout
+        self.max_queued = max_queued
+        # Identifies this process's leases
+        self.owner = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                id_card BLOB,
+                selfie BLOB,
+                result TEXT,
+                error TEXT
+            )"""
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("owner TEXT", "lease_expires_at REAL"):
+            if column.split()[0] not in columns:
+                self.conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        # Jobs left running before leases existed are claimed again straight away
+        self.conn.execute("UPDATE jobs SET lease_expires_at = 0 WHERE status = 'running' AND lease_expires_at IS NULL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created_at)")
+    
+    def prune(self, retention_seconds: float) -> int:
+        """Drop finished jobs past retention"""
+        with self.lock:
+            return self.conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (time.time() - retention_seconds,)
+            ).rowcount
+    
+    def enqueue(self, id_card: bytes, selfie: bytes) -> str:
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self.max_queued:
+                    raise JobQueueFull(f"{queued} jobs already queued")
+                self.conn.execute(
+                    "INSERT INTO jobs (id, status, created_at, id_card, selfie) VALUES (?, 'queued', ?, ?, ?)",
+                    (job_id, time.time(), bytes(id_card), bytes(selfie))
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return job_id
+    
+    def _expire(self, now: float, job_id: Optional[str] = None):
+        """Fail jobs that ran out of attempts or waited too long in the queue"""
+        where, params = ("AND id = ?", (job_id,)) if job_id else ("", ())
+        self.conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'Gave up after ' || attempts || ' interrupted attempts', "
+            f"id_card = NULL, selfie = NULL WHERE status = 'running' AND lease_expires_at < ? AND attempts >= ? {where}",
+            (now, now, self.max_attempts, *params)
+        )
+        self.conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, id_card = NULL, selfie = NULL "
+            f"WHERE status = 'queued' AND created_at < ? {where}",
+            (now, f"Not started within {self.queue_timeout:.0f}s", now - self.queue_timeout, *params)
+        )
+    
+    def claim(self) -> Optional[Tuple[str, bytes, bytes]]:
+        """Lease the oldest queued job, or one whose lease expired, to this process and return its inputs"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._expire(now)
+                row = self.conn.execute(
+                    """UPDATE jobs SET status = 'running', owner = ?, started_at = ?, lease_expires_at = ?, attempts = attempts + 1
+                    WHERE id = (
+                        SELECT id FROM jobs
+                        WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                        ORDER BY created_at LIMIT 1
+                    )
+                    RETURNING id, id_card, selfie""",
+                    (self.owner, now, now + self.lease_seconds, now)
+                ).fetchone()
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return tuple(row) if row else None
+    
+    def renew(self, job_id: str) -> bool:
+        """Extend this process's lease on a running job; False if the lease was lost"""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, self.owner)
+            ).rowcount == 1
+    
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
+        """Record the outcome of a job this process holds; False if another process has taken it over"""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ?, id_card = NULL, selfie = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id, self.owner)
+            ).rowcount == 1
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            self._expire(time.time(), job_id)
+            row = self.conn.execute(
+                "SELECT status, created_at, started_at, finished_at, attempts, result, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, created_at, started_at, finished_at, attempts, result, error = row
         return {
-            "verification_id": timestamp,
-            "face_verified": face_result["verified"],
-            "face_confidence": 1.0 - face_result["distance"],
-            "extracted_info": extracted_text,
-            "extraction_method": "AI-powered vision",
-            "status": "success",
-            "message": "AI-powered KYC verification completed successfully"
+            "job_id": job_id,
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "attempts": attempts,
+            "result": json.loads(result) if result is not None else None,
+            "error": error
         }
+    
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+job_store: Optional[JobStore] = None
+# Set when a job is enqueued; idle workers also poll every JOB_POLL_INTERVAL
+job_wakeup = asyncio.Event()
+# Per-job completion events for long-polling clients
+job_waiters: Dict[str, asyncio.Event] = {}
+
+async def renew_job_lease(job_id: str):
+    """Keep the lease on a running job while it runs"""
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        try:
+            await asyncio.to_thread(job_store.renew, job_id)
+        except Exception as e:
+            logger.warning(f"Could not renew the lease on job {job_id}: {str(e)}")
+
+async def job_worker():
+    """Claim queued jobs one at a time and run the in-memory KYC pipeline on them"""
+    while True:
+        if not face_pipeline.status["ready"]:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        job_wakeup.clear()
+        job = await asyncio.to_thread(job_store.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
         
-    except Exception as e:
-        # Clean up temporary files in case of error
-        if 'id_card_path' in locals() and os.path.exists(id_card_path):
-            os.remove(id_card_path)
-        if 'selfie_path' in locals() and os.path.exists(selfie_path):
-            os.remove(selfie_path)
-        if 'temp_dir' in locals() and os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
-        raise HTTPException(status_code=500, detail=f"AI KYC verification error: {str(e)}")
+        job_id, id_card_bytes, selfie_bytes = job
+        heartbeat = asyncio.create_task(renew_job_lease(job_id))
+        try:
+            result = await verify_in_memory(id_card_bytes, selfie_bytes)
+            outcome = ("done", result, None)
+        except HTTPException as e:
+            outcome = ("failed", None, str(e.detail))
+        except Exception as e:
+            outcome = ("failed", None, str(e))
+        finally:
+            heartbeat.cancel()
+        if not await asyncio.to_thread(job_store.finish, job_id, *outcome):
+            logger.warning(f"Lost the lease on job {job_id}; another process has taken it over")
+        waiter = job_waiters.pop(job_id, None)
+        if waiter:
+            waiter.set()
+
+async def start_job_workers() -> List[asyncio.Task]:
+    """Open the job store, drop expired jobs and start JOB_WORKERS workers"""
+    global job_store
+    job_store = JobStore(JOBS_DB_PATH, JOB_MAX_ATTEMPTS, JOB_LEASE_SECONDS, JOB_QUEUE_TIMEOUT, JOB_MAX_QUEUED)
+    await asyncio.to_thread(job_store.prune, JOB_RETENTION_SECONDS)
+    return [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+
+async def stop_job_workers(workers: List[asyncio.Task]):
+    """Cancel the workers; jobs they were running are claimed again once their lease expires"""
+    global job_store
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    job_store.close()
+    job_store = None
+
+async def enqueue_job(id_card_bytes: bytes, selfie_bytes: bytes) -> Dict[str, Any]:
+    # Queueing while models load is fine, but a failed warm-up would leave jobs waiting
+    if face_pipeline.status["error"]:
+        face_pipeline.require_ready()
+    try:
+        job_id = await asyncio.to_thread(job_store.enqueue, id_card_bytes, selfie_bytes)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue is full: {str(e)}", headers={"Retry-After": "30"})
+    job_wakeup.set()
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.post("/jobs/id-verify", status_code=202)
+async def create_id_verify_job(
+    id_card: UploadFile = File(..., description="ID card image"),
+    selfie: UploadFile = File(..., description="Selfie image")
+):
+    """
+    Queue a KYC verification and return its job ID immediately; poll GET /jobs/{job_id} for the result
+    """
+    if not id_card.content_type.startswith("image/") or not selfie.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Both files must be images")
+    
+    return await enqueue_job(await id_card.read(), await selfie.read())
+
+@app.post("/jobs/id-verify-base64", status_code=202, openapi_extra=BASE64_BODY_SCHEMA)
+async def create_id_verify_base64_job(request: Request):
+    """
+    Queue a KYC verification from base64 encoded images, as /id-verify-base64
+    """
+    id_card_bytes, selfie_bytes = await read_base64_images(request)
+    return await enqueue_job(id_card_bytes, selfie_bytes)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Job status and, once done, the /id-verify-base64 response. With wait > 0 the request is held
+    until the job finishes or wait seconds (at most JOB_MAX_WAIT) pass.
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if wait <= 0 or job["status"] in ("done", "failed"):
+        return job
+    
+    # The worker that finishes the job sets and removes the event
+    waiter = job_waiters.setdefault(job_id, asyncio.Event())
+    # Re-read after registering so a job finishing in between is not missed. Jobs run by
+    # another process don't set the event, so the store is also re-read every poll interval.
+    deadline = time.monotonic() + min(wait, JOB_MAX_WAIT)
+    job = await asyncio.to_thread(job_store.get, job_id)
+    while job["status"] not in ("done", "failed") and time.monotonic() < deadline:
+        try:
+            await asyncio.wait_for(waiter.wait(), min(deadline - time.monotonic(), JOB_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+        job = await asyncio.to_thread(job_store.get, job_id)
+    if job_waiters.get(job_id) is waiter:
+        del job_waiters[job_id]
+    return job
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="ZKYC Qwen Service")
+    parser.add_argument("--prepare-weights", action="store_true", help="Download model weights into MODEL_WEIGHTS_DIR and write its checksum manifest")
+    args = parser.parse_args()
+    if args.prepare_weights:
+        if not MODEL_WEIGHTS_DIR:
+            parser.error("MODEL_WEIGHTS_DIR must be set to prepare the weight bundle")
+        face_pipeline.warm_up(prepare=True)
+        write_weight_manifest(MODEL_WEIGHTS_DIR)
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,27 @@
+import importlib.util
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_module(name: str, filename: str):
+    """Import a file of this service under its own name, so the services' `main` modules
+    don't shadow each other when the whole repo is tested in one run"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SERVICE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+qwen_main = load_module("qwen_main", "main.py")
+
+# backfill.py runs next to main.py and imports it as `main`
+shadowed = sys.modules.get("main")
+sys.modules["main"] = qwen_main
+try:
+    load_module("qwen_backfill", "backfill.py")
+finally:
+    if shadowed is None:
+        del sys.modules["main"]
+    else:
+        sys.modules["main"] = shadowed
@@ -0,0 +1,199 @@
+import asyncio
+import io
+import json
+import shutil
+import tarfile
+
+import pytest
+
+import qwen_backfill
+import qwen_main
+from zkyc_common.verification_log import VerificationLog
+
+def make_pairs(root, count):
+    for i in range(count):
+        pair_dir = root / f"pair-{i:02d}"
+        pair_dir.mkdir(parents=True)
+        (pair_dir / "id_card.jpg").write_bytes(f"id-{i}".encode())
+        (pair_dir / "selfie.jpg").write_bytes(f"selfie-{i}".encode())
+
+def pair_ids(pairs):
+    return [pair[0] for pair in pairs]
+
+class FakeClient:
+    async def aclose(self):
+        pass
+
+class FakeExecutor:
+    async def run(self, fn, *args):
+        pass
+
+    def shutdown(self):
+        pass
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    """The parts of the service backfill starts and stops, minus Ollama and the models"""
+    monkeypatch.setattr(qwen_main, "create_ollama_client", FakeClient)
+    monkeypatch.setattr(qwen_main, "inference_executor", FakeExecutor())
+    log = VerificationLog(str(tmp_path / "verifications.sqlite3"), 64, 0.01, 0)
+    monkeypatch.setattr(qwen_main, "verification_log", log)
+    return log
+
+@pytest.fixture
+def verify(monkeypatch, service):
+    """Verify pairs without models; later pairs finish first, so writes have to wait for earlier ones"""
+    calls = []
+
+    async def verify_in_memory(id_card_bytes, selfie_bytes):
+        index = int(id_card_bytes.split(b"-")[1])
+        calls.append(index)
+        await asyncio.sleep(0.001 * (10 - index % 10))
+        if index == 3:
+            raise ValueError("no face")
+        return {"id_card": id_card_bytes.decode(), "selfie": selfie_bytes.decode()}
+
+    monkeypatch.setattr(qwen_main, "verify_in_memory", verify_in_memory)
+    return calls
+
+def read_records(output):
+    with open(output, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_completed_count_of_a_missing_file(tmp_path):
+    assert qwen_backfill.completed_count(str(tmp_path / "results.jsonl")) == 0
+
+def test_completed_count_counts_finished_lines(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_bytes(b'{"index": 0}\n{"index": 1}\n')
+    assert qwen_backfill.completed_count(str(output)) == 2
+    assert output.read_bytes() == b'{"index": 0}\n{"index": 1}\n'
+
+def test_completed_count_truncates_a_partial_last_line(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_bytes(b'{"index": 0}\n{"index": 1}\n{"ind')
+    assert qwen_backfill.completed_count(str(output)) == 2
+    assert output.read_bytes() == b'{"index": 0}\n{"index": 1}\n'
+    output.write_bytes(b'{"ind')
+    assert qwen_backfill.completed_count(str(output)) == 0
+    assert output.read_bytes() == b""
+
+def test_directory_pairs_skip_completed(tmp_path):
+    make_pairs(tmp_path / "pairs", 4)
+    (tmp_path / "pairs" / "pair-04").mkdir()
+    pairs = list(qwen_backfill.iter_pairs(str(tmp_path / "pairs"), skip=2))
+    assert pair_ids(pairs) == ["pair-02", "pair-03", "pair-04"]
+    assert pairs[0][1:] == (b"id-2", b"selfie-2", None)
+    assert pairs[2][1:3] == (None, None)
+    assert "missing id_card, selfie" in pairs[2][3]
+
+def test_manifest_pairs_skip_completed(tmp_path):
+    make_pairs(tmp_path, 3)
+    lines = [json.dumps({"id": f"p{i}", "id_card": f"pair-{i:02d}/id_card.jpg", "selfie": f"pair-{i:02d}/selfie.jpg"}) for i in range(3)]
+    manifest = tmp_path / "pairs.ndjson"
+    manifest.write_text("\n".join(lines[:2] + ["", "not json", lines[2]]) + "\n")
+    pairs = list(qwen_backfill.iter_pairs(str(manifest), skip=1))
+    assert pair_ids(pairs) == ["p1", "4", "p2"]
+    assert pairs[1][3].startswith("Invalid manifest entry on line 4")
+    assert pairs[2][1:] == (b"id-2", b"selfie-2", None)
+
+def test_tar_pairs_skip_completed(tmp_path):
+    archive = tmp_path / "pairs.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        for name, data in [("a/id_card.jpg", b"id-0"), ("b/id_card.jpg", b"id-1"), ("a/selfie.jpg", b"selfie-0"),
+                           ("c/selfie.jpg", b"selfie-2"), ("b/selfie.jpg", b"selfie-1")]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    assert pair_ids(qwen_backfill.iter_pairs(str(archive))) == ["a", "b", "c"]
+    pairs = list(qwen_backfill.iter_pairs(str(archive), skip=1))
+    assert pair_ids(pairs) == ["b", "c"]
+    assert pairs[0][1:] == (b"id-1", b"selfie-1", None)
+    assert "missing id_card" in pairs[1][3]
+
+def test_unsupported_source(tmp_path):
+    source = tmp_path / "pairs.txt"
+    source.write_text("pairs")
+    with pytest.raises(ValueError):
+        qwen_backfill.iter_pairs(str(source))
+
+def test_backfill_writes_results_in_input_order(tmp_path, verify):
+    make_pairs(tmp_path / "pairs", 6)
+    output = str(tmp_path / "results.jsonl")
+    counts = asyncio.run(qwen_backfill.backfill(str(tmp_path / "pairs"), output, workers=3, window=4))
+    assert counts == {"skipped": 0, "done": 5, "failed": 1}
+    records = read_records(output)
+    assert [record["index"] for record in records] == list(range(6))
+    assert [record["pair_id"] for record in records] == [f"pair-{i:02d}" for i in range(6)]
+    assert records[3] == {"index": 3, "pair_id": "pair-03", "status": "failed", "error": "no face"}
+    assert records[5]["result"] == {"id_card": "id-5", "selfie": "selfie-5"}
+
+def test_backfill_resumes_after_an_interruption(tmp_path, verify):
+    make_pairs(tmp_path / "pairs", 6)
+    output = tmp_path / "results.jsonl"
+    asyncio.run(qwen_backfill.backfill(str(tmp_path / "pairs"), str(output), workers=2, window=2))
+    complete = output.read_bytes()
+    # Interrupted while writing the fourth result
+    lines = complete.splitlines(keepends=True)
+    output.write_bytes(b"".join(lines[:3]) + lines[3][:10])
+    verify.clear()
+
+    counts = asyncio.run(qwen_backfill.backfill(str(tmp_path / "pairs"), str(output), workers=2, window=2))
+    assert counts == {"skipped": 3, "done": 2, "failed": 1}
+    assert sorted(verify) == [3, 4, 5]
+    assert output.read_bytes() == complete
+
+def test_last_pair_id(tmp_path):
+    output = tmp_path / "results.jsonl"
+    output.write_text(json.dumps({"index": 0, "pair_id": "only"}) + "\n")
+    assert qwen_backfill.last_pair_id(str(output)) == "only"
+    lines = [json.dumps({"index": i, "pair_id": f"p{i}", "error": "x" * 50_000}) for i in range(3)]
+    output.write_text("\n".join(lines) + "\n")
+    assert qwen_backfill.last_pair_id(str(output)) == "p2"
+
+def test_resume_is_refused_when_the_source_changed(tmp_path, verify):
+    pairs = tmp_path / "pairs"
+    make_pairs(pairs, 4)
+    output = tmp_path / "results.jsonl"
+    asyncio.run(qwen_backfill.backfill(str(pairs), str(output), workers=2, window=2))
+    lines = output.read_bytes().splitlines(keepends=True)
+    output.write_bytes(b"".join(lines[:2]))
+
+    # pair-01 was the last pair written; removing it shifts pair-02 into its place
+    shutil.rmtree(pairs / "pair-01")
+    verify.clear()
+    with pytest.raises(ValueError, match="pair 2 of .* is 'pair-01' but .* has pair 'pair-02' there"):
+        asyncio.run(qwen_backfill.backfill(str(pairs), str(output), workers=2, window=2))
+    assert verify == []
+    assert output.read_bytes() == b"".join(lines[:2])
+
+    # Fewer pairs left than already written
+    for pair_dir in ("pair-00", "pair-02"):
+        shutil.rmtree(pairs / pair_dir)
+    with pytest.raises(ValueError, match="has no pair there"):
+        qwen_backfill.resume_pairs(str(pairs), str(output))
+
+def test_backfill_results_are_in_the_verification_log(tmp_path, monkeypatch, service):
+    async def extract_id_document(image_bytes, endpoint):
+        return {"name": image_bytes.decode()}
+
+    async def verify_faces(id_card_bytes, selfie_bytes):
+        return {"verified": True, "distance": 0.25, "threshold": 0.68, "model": "VGG-Face"}
+
+    monkeypatch.setattr(qwen_main, "extract_id_document", extract_id_document)
+    monkeypatch.setattr(qwen_main.face_pipeline, "verify_faces", verify_faces)
+    make_pairs(tmp_path / "pairs", 2)
+    output = str(tmp_path / "results.jsonl")
+    asyncio.run(qwen_backfill.backfill(str(tmp_path / "pairs"), output, workers=2, window=2))
+
+    log = VerificationLog(service.path, 64, 0.01, 0)
+    log.open()
+    try:
+        for i, record in enumerate(read_records(output)):
+            result = record["result"]
+            assert result["verification_log"] == f"/verifications/{result['verification_id']}"
+            logged = log.get(result["verification_id"])
+            assert logged["ai_extraction"]["extracted_info"] == {"name": f"id-{i}"}
+            assert logged["face_verification"]["distance"] == 0.25
+    finally:
+        log.close()
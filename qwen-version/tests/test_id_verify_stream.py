@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import qwen_main
+from zkyc_common.verification_log import VerificationLog
+
+TOKENS = ['{"name": ', '"Ada", ', '"surname": ', '"Lovelace"}']
+
+class FakeStream:
+    """Stands in for stream_qwen_vision, yielding TOKENS `delay` seconds apart"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = 0
+        self.cancelled = False
+
+    async def __call__(self, *args, **kwargs):
+        try:
+            for token in TOKENS:
+                await asyncio.sleep(self.delay)
+                self.sent += 1
+                yield token
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(qwen_main.face_pipeline.status, "ready", True)
+    monkeypatch.setattr(qwen_main, "verification_log", VerificationLog(":memory:", 64, 0.01, 0))
+    return TestClient(qwen_main.app)
+
+def post_stream(client):
+    files = {"id_card": ("id.jpg", b"id", "image/jpeg"), "selfie": ("selfie.jpg", b"selfie", "image/jpeg")}
+    response = client.post("/id-verify/stream", files=files)
+    assert response.status_code == 200
+    events = []
+    for block in response.text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_streams_tokens_then_the_result(client, monkeypatch):
+    async def verify_faces(id_card_bytes, selfie_bytes):
+        return {"verified": True, "distance": 0.25, "threshold": 0.68, "model": "VGG-Face"}
+
+    monkeypatch.setattr(qwen_main, "stream_qwen_vision", FakeStream(0))
+    monkeypatch.setattr(qwen_main.face_pipeline, "verify_faces", verify_faces)
+    events = post_stream(client)
+    assert [data["token"] for event, data in events[:-1]] == TOKENS
+    event, result = events[-1]
+    assert event == "result"
+    assert (result["face_verified"], result["id_document"]["surname"]) == (True, "Lovelace")
+
+def test_face_failure_cuts_the_extraction_short(client, monkeypatch):
+    async def verify_faces(id_card_bytes, selfie_bytes):
+        await asyncio.sleep(0.05)
+        raise ValueError("Face could not be detected")
+
+    stream = FakeStream(0.5)
+    monkeypatch.setattr(qwen_main, "stream_qwen_vision", stream)
+    monkeypatch.setattr(qwen_main.face_pipeline, "verify_faces", verify_faces)
+    events = post_stream(client)
+    assert events == [("error", {"detail": "AI KYC verification error: Face could not be detected"})]
+    assert stream.sent == 0
+    assert stream.cancelled
@@ -0,0 +1,121 @@
+import sqlite3
+
+import pytest
+
+import qwen_main
+from qwen_main import JobQueueFull, JobStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(qwen_main.time, "time", clock)
+    return clock
+
+def open_store(tmp_path, **overrides):
+    options = {"max_attempts": 2, "lease_seconds": 60, "queue_timeout": 3600, "max_queued": 10, **overrides}
+    return JobStore(str(tmp_path / "jobs.sqlite3"), **options)
+
+def test_jobs_are_claimed_once_in_order(tmp_path, clock):
+    store = open_store(tmp_path)
+    first = store.enqueue(b"id-1", b"selfie-1")
+    clock.now += 1
+    second = store.enqueue(b"id-2", b"selfie-2")
+    assert store.claim() == (first, b"id-1", b"selfie-1")
+    assert store.claim() == (second, b"id-2", b"selfie-2")
+    assert store.claim() is None
+    assert store.get(first)["status"] == "running"
+    assert store.stats() == {"running": 2}
+
+def test_finish_records_the_result_and_drops_the_images(tmp_path, clock):
+    store = open_store(tmp_path)
+    job_id = store.enqueue(b"id", b"selfie")
+    store.claim()
+    assert store.finish(job_id, "done", result={"verified": True})
+    job = store.get(job_id)
+    assert (job["status"], job["result"], job["attempts"]) == ("done", {"verified": True}, 1)
+    assert store.conn.execute("SELECT id_card, selfie FROM jobs").fetchone() == (None, None)
+    assert store.get("missing") is None
+
+def test_queue_limit(tmp_path, clock):
+    store = open_store(tmp_path, max_queued=2)
+    store.enqueue(b"a", b"a")
+    store.enqueue(b"b", b"b")
+    with pytest.raises(JobQueueFull):
+        store.enqueue(b"c", b"c")
+    store.claim()
+    store.enqueue(b"c", b"c")
+
+def test_expired_lease_is_claimed_by_another_process(tmp_path, clock):
+    crashed, other = open_store(tmp_path), open_store(tmp_path)
+    job_id = crashed.enqueue(b"id", b"selfie")
+    crashed.claim()
+    clock.now += 30
+    assert other.claim() is None
+    clock.now += 31
+    assert other.claim() == (job_id, b"id", b"selfie")
+    # The crashed process's late result is discarded
+    assert not crashed.finish(job_id, "done", result={})
+    assert not crashed.renew(job_id)
+    assert other.finish(job_id, "done", result={"verified": False})
+    assert other.get(job_id)["attempts"] == 2
+
+def test_renewed_lease_is_kept(tmp_path, clock):
+    worker, other = open_store(tmp_path), open_store(tmp_path)
+    worker.enqueue(b"id", b"selfie")
+    job_id, _, _ = worker.claim()
+    for _ in range(3):
+        clock.now += 40
+        assert worker.renew(job_id)
+        assert other.claim() is None
+
+def test_job_fails_after_max_attempts(tmp_path, clock):
+    store = open_store(tmp_path, max_attempts=2)
+    job_id = store.enqueue(b"id", b"selfie")
+    store.claim()
+    clock.now += 61
+    store.claim()
+    clock.now += 61
+    assert store.claim() is None
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert "2 interrupted attempts" in job["error"]
+
+def test_job_fails_when_not_started_in_time(tmp_path, clock):
+    store = open_store(tmp_path, queue_timeout=100)
+    job_id = store.enqueue(b"id", b"selfie")
+    clock.now += 101
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert "Not started within 100s" in job["error"]
+    assert store.claim() is None
+
+def test_prune_drops_only_old_finished_jobs(tmp_path, clock):
+    store = open_store(tmp_path)
+    old = store.enqueue(b"a", b"a")
+    store.claim()
+    store.finish(old, "done", result={})
+    queued = store.enqueue(b"b", b"b")
+    clock.now += 1000
+    assert store.prune(500) == 1
+    assert store.get(old) is None
+    assert store.get(queued)["status"] == "queued"
+
+def test_running_jobs_from_before_leases_are_claimed_again(tmp_path, clock):
+    path = tmp_path / "jobs.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, created_at REAL NOT NULL, started_at REAL, "
+        "finished_at REAL, attempts INTEGER NOT NULL DEFAULT 0, id_card BLOB, selfie BLOB, result TEXT, error TEXT)"
+    )
+    conn.execute("INSERT INTO jobs (id, status, created_at, attempts, id_card, selfie) VALUES ('old', 'running', ?, 1, x'01', x'02')", (clock.now,))
+    conn.commit()
+    conn.close()
+    store = open_store(tmp_path)
+    assert store.claim() == ("old", b"\x01", b"\x02")
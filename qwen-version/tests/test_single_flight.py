@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from qwen_main import SingleFlightCache
+
+class Factory:
+    def __init__(self, result="text", error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+def test_concurrent_misses_share_one_call():
+    async def run():
+        cache = SingleFlightCache(8, 60)
+        factory = Factory()
+        callers = [asyncio.create_task(cache.get_or_run("k", factory)) for _ in range(5)]
+        await asyncio.sleep(0)
+        factory.release.set()
+        assert await asyncio.gather(*callers) == ["text"] * 5
+        assert factory.calls == 1
+        assert cache.stats()["coalesced"] == 4
+        assert await cache.get_or_run("k", factory) == "text"
+        assert factory.calls == 1
+        assert cache.stats()["in_flight"] == 0
+    asyncio.run(run())
+
+def test_failures_are_shared_but_not_cached():
+    async def run():
+        cache = SingleFlightCache(8, 60)
+        failing = Factory(error=RuntimeError("ollama down"))
+        callers = [asyncio.create_task(cache.get_or_run("k", failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert [str(r) for r in results] == ["ollama down"] * 2
+        retry = Factory()
+        retry.release.set()
+        assert await cache.get_or_run("k", retry) == "text"
+        assert retry.calls == 1
+    asyncio.run(run())
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def run():
+        cache = SingleFlightCache(8, 60)
+        factory = Factory()
+        first = asyncio.create_task(cache.get_or_run("k", factory))
+        second = asyncio.create_task(cache.get_or_run("k", factory))
+        await asyncio.sleep(0)
+        first.cancel()
+        factory.release.set()
+        assert await second == "text"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+    asyncio.run(run())
+
+def test_registered_call_is_joined_and_cached():
+    async def run():
+        cache = SingleFlightCache(8, 60)
+        assert cache.join("k") is None
+        result = cache.register("k")
+        joined = cache.join("k")
+        waiter = asyncio.create_task(cache.get_or_run("k", Factory()))
+        await asyncio.sleep(0)
+        result.set_result("streamed")
+        assert await asyncio.shield(joined) == "streamed"
+        assert await waiter == "streamed"
+        await asyncio.sleep(0)
+        assert cache.results.get("k") == "streamed"
+        assert cache.stats()["coalesced"] == 2
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+import base64
+import json
+
+import pytest
+
+from qwen_main import StreamingBase64Fields, UploadTooLargeError
+
+FIELDS = ("id_card_base64", "selfie_base64")
+
+def decode(body: bytes, chunk_size: int = 0, max_bytes: int = 1 << 20) -> StreamingBase64Fields:
+    decoder = StreamingBase64Fields(FIELDS, max_bytes)
+    step = chunk_size or len(body) or 1
+    for i in range(0, len(body), step):
+        decoder.feed(body[i:i + step])
+    decoder.close()
+    return decoder
+
+def b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+ID_CARD = bytes(range(256)) * 3
+SELFIE = b"selfie bytes \xff\xfe"
+
+@pytest.mark.parametrize("chunk_size", [0, 1, 2, 3, 5, 7, 64])
+def test_decodes_fields_at_any_chunk_boundary(chunk_size):
+    body = json.dumps({"id_card_base64": b64(ID_CARD), "note": "skipped", "selfie_base64": b64(SELFIE)}).encode()
+    decoder = decode(body, chunk_size)
+    assert decoder.fields == {"id_card_base64": ID_CARD, "selfie_base64": SELFIE}
+
+@pytest.mark.parametrize("chunk_size", [0, 1, 3])
+def test_value_escapes(chunk_size):
+    # json.dumps escapes nothing in base64; other encoders write "/" as "\/" or "/" and may wrap lines
+    text = b64(ID_CARD)
+    assert "/" in text
+    parts = text.split("/")
+    escaped = "".join(part + ("\\/" if i % 2 else "\\u002f") for i, part in enumerate(parts[:-1])) + parts[-1]
+    escaped = escaped.replace("A", "A\\n", 1)
+    body = ('{"id_card_base64": "%s", "selfie_base64": "%s"}' % (escaped, b64(SELFIE))).encode()
+    assert decode(body, chunk_size).fields["id_card_base64"] == ID_CARD
+
+@pytest.mark.parametrize("chunk_size", [0, 1])
+def test_key_escapes(chunk_size):
+    body = (
+        '{"id_card\\u005fbase64": "%s", "x\\"y": "skipped \\" quote", "a\\\\": "", "selfie_base64": "%s"}'
+        % (b64(ID_CARD), b64(SELFIE))
+    ).encode()
+    assert decode(body, chunk_size).fields == {"id_card_base64": ID_CARD, "selfie_base64": SELFIE}
+
+def test_duplicate_field_is_rejected():
+    body = ('{"id_card_base64": "%s", "id_card_base64": "%s"}' % (b64(b"first"), b64(b"second"))).encode()
+    with pytest.raises(ValueError, match="duplicate"):
+        decode(body)
+
+def test_duplicate_unwanted_field_is_skipped():
+    body = ('{"note": "a", "note": "b", "id_card_base64": "%s"}' % b64(ID_CARD)).encode()
+    assert decode(body).fields["id_card_base64"] == ID_CARD
+
+def test_missing_field_stays_empty():
+    assert decode(b'{"id_card_base64": ""}').fields == {"id_card_base64": b"", "selfie_base64": b""}
+
+@pytest.mark.parametrize("body", [
+    b'{"id_card_base64": "QUJD"',
+    b'{"id_card_base64": "QUJD",',
+    b'{"id_card_base64"',
+    b"",
+])
+def test_truncated_body(body):
+    with pytest.raises(ValueError, match="truncated"):
+        decode(body)
+
+@pytest.mark.parametrize("body", [
+    b'["id_card_base64"]',
+    b'{"id_card_base64": 1}',
+    b'{"id_card_base64" "QUJD"}',
+    b'{"id_card_base64": "QUJD" "selfie_base64": ""}',
+    b'{"id_card_base64": "QUJD\\q"}',
+    b'{"id_card_base64": "QUJD"} trailing',
+])
+def test_malformed_body(body):
+    with pytest.raises(ValueError):
+        decode(body)
+
+def test_decoded_size_limit():
+    body = json.dumps({"id_card_base64": b64(b"x" * 600), "selfie_base64": b64(b"y" * 600)}).encode()
+    with pytest.raises(UploadTooLargeError):
+        decode(body, 16, max_bytes=1000)
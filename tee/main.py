@@ -1,15 +1,116 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
-from deepface import DeepFace
-import tempfile
+from fastapi.responses import JSONResponse, Response
 import os
+import sys
+
+# Helpers shared by the services live in zkyc_common at the repo root; images copy it next to main.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# DeepFace looks for weights under $DEEPFACE_HOME/.deepface/weights, so point it
+# at the local weight bundle before the library is imported
+MODEL_WEIGHTS_DIR = os.getenv("MODEL_WEIGHTS_DIR")
+if MODEL_WEIGHTS_DIR:
+    os.environ.setdefault("DEEPFACE_HOME", MODEL_WEIGHTS_DIR)
+
+from contextlib import asynccontextmanager
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from zkyc_common.inference import InferenceExecutor
+from zkyc_common.cache import TTLCache
+from zkyc_common.faces import FacePipeline
+from zkyc_common.weights import write_weight_manifest
+from zkyc_common.admission import AdmissionMiddleware, admission_limiter
+from zkyc_common.metrics import AdmissionCollector, MetricsMiddleware
+import asyncio
+import logging
 from pathlib import Path
 
-app = FastAPI()
+logger = logging.getLogger("uvicorn.error")
+
+# Inference executor configuration
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+inference_executor = InferenceExecutor(INFERENCE_WORKERS)
+
+# Face model configuration
+FACE_MODEL = os.getenv("FACE_MODEL", "VGG-Face")
+FACE_DETECTOR = os.getenv("FACE_DETECTOR", "opencv")
+FACE_DISTANCE_METRIC = os.getenv("FACE_DISTANCE_METRIC", "cosine")
+
+# Face embedding cache configuration
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "256"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+
+# Face embedding micro-batching configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "16"))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+
+face_pipeline = FacePipeline(
+    FACE_MODEL,
+    FACE_DETECTOR,
+    FACE_DISTANCE_METRIC,
+    inference_executor,
+    TTLCache(EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL),
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_WAIT_MS,
+    MODEL_WEIGHTS_DIR
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the models on startup and release the inference pool on shutdown"""
+    warm_up_task = asyncio.create_task(face_pipeline.warm_up_in_background())
+    try:
+        yield
+    finally:
+        warm_up_task.cancel()
+        inference_executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Admission control: per-endpoint concurrency limits with a bounded wait queue, configured by
+# ADMISSION_CONCURRENCY_<ENDPOINT> / ADMISSION_QUEUE_<ENDPOINT> / ADMISSION_MAX_WAIT_<ENDPOINT>
+admission_limiters = {
+    "face_recognition": admission_limiter("face_recognition", 4, 8)
+}
+
+# Request paths guarded by each limiter
+ADMISSION_ROUTES = {
+    "/face-recognition": admission_limiters["face_recognition"]
+}
+
+REGISTRY.register(AdmissionCollector(admission_limiters))
+
+# Innermost of the two, so only admitted requests are measured
+app.add_middleware(MetricsMiddleware, paths=ADMISSION_ROUTES)
+app.add_middleware(AdmissionMiddleware, routes=ADMISSION_ROUTES)
 
 @app.post("/")
 async def post_root():
     return {"message": "Hello World", "method": "POST"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once startup model warm-up has finished, 503 before"""
+    if not face_pipeline.status["ready"]:
+        return JSONResponse(status_code=503, content=face_pipeline.status)
+    return face_pipeline.status
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/inference-stats")
+async def inference_stats():
+    """Inference pool, admission limiter, embedding cache and embedding batcher counters"""
+    return {
+        "executor": inference_executor.stats(),
+        "admission": {name: limiter.stats() for name, limiter in admission_limiters.items()},
+        "embedding_cache": face_pipeline.cache.stats(),
+        "embedding_batcher": face_pipeline.batcher.stats()
+    }
+
 @app.post("/face-recognition")
 async def face_recognition(
     img1: UploadFile = File(..., description="First image for comparison"),
@@ -18,35 +119,19 @@ async def face_recognition(
     """
     Compare two uploaded images to verify if they contain the same person
     """
+    face_pipeline.require_ready()
     
     # Check if files are images
     allowed_types = ["image/jpeg", "image/jpg", "image/png", "image/gif", "image/bmp"]
     if img1.content_type not in allowed_types or img2.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Only image files are allowed")
     
-    # Create temporary files to save uploaded images
-    temp_dir = tempfile.mkdtemp()
+    img1_bytes = await img1.read()
+    img2_bytes = await img2.read()
     
     try:
-        # Save first image
-        img1_path = os.path.join(temp_dir, f"img1_{img1.filename}")
-        with open(img1_path, "wb") as f:
-            content = await img1.read()
-            f.write(content)
-        
-        # Save second image
-        img2_path = os.path.join(temp_dir, f"img2_{img2.filename}")
-        with open(img2_path, "wb") as f:
-            content = await img2.read()
-            f.write(content)
-        
-        # Perform face verification
-        result = DeepFace.verify(img1_path=img1_path, img2_path=img2_path)
-        
-        # Clean up temporary files
-        os.remove(img1_path)
-        os.remove(img2_path)
-        os.rmdir(temp_dir)
+        # Perform face verification on cached, content-addressed embeddings
+        result = await face_pipeline.verify_faces(img1_bytes, img2_bytes, enforce_detection=True)
         
         return {
             "verified": result["verified"],
@@ -59,17 +144,21 @@ async def face_recognition(
             "message": "Same person" if result["verified"] else "Different people"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up temporary files in case of error
-        if os.path.exists(img1_path):
-            os.remove(img1_path)
-        if os.path.exists(img2_path):
-            os.remove(img2_path)
-        if os.path.exists(temp_dir):
-            os.rmdir(temp_dir)
-        
         raise HTTPException(status_code=500, detail=f"Face recognition error: {str(e)}")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="ZKYC TEE Face Recognition Service")
+    parser.add_argument("--prepare-weights", action="store_true", help="Download model weights into MODEL_WEIGHTS_DIR and write its checksum manifest")
+    args = parser.parse_args()
+    if args.prepare_weights:
+        if not MODEL_WEIGHTS_DIR:
+            parser.error("MODEL_WEIGHTS_DIR must be set to prepare the weight bundle")
+        face_pipeline.warm_up(prepare=True)
+        write_weight_manifest(MODEL_WEIGHTS_DIR)
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+Fake Telegram Bot API for trying the bot's webhook mode locally, without a bot token or network.
+
+    python fake_telegram.py --port 8081 --users 20
+    TOKEN=123:fake TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+        WEBHOOK_URL=http://127.0.0.1:8080 WEBHOOK_SECRET_TOKEN=local-secret python main.py
+
+Once the bot registers its webhook, the fake posts a /start message from each of `--users`
+users with the registered secret token, and one with a wrong token. It exits 0 if every
+user got the welcome message and the wrong token was rejected with 403, 1 otherwise.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "ZKYC", "username": "zkyc_fake_bot"}
+
+class FakeTelegram:
+    """What the bot has called so far"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.webhook = None
+        self.webhook_set = threading.Event()
+        self.sent = {}
+        self.message_id = 0
+
+    def record_message(self, params):
+        with self.lock:
+            self.message_id += 1
+            chat_id = int(params["chat_id"])
+            self.sent.setdefault(chat_id, []).append(params.get("text", ""))
+            return {
+                "message_id": self.message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", "")
+            }
+
+state = FakeTelegram()
+
+def read_params(handler: BaseHTTPRequestHandler):
+    body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+    if not body:
+        return {}
+    if handler.headers.get("Content-Type", "").startswith("application/json"):
+        return json.loads(body)
+    # python-telegram-bot sends form fields, with nested values JSON-encoded
+    params = {}
+    for key, values in parse_qs(body.decode()).items():
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    """Answers the Bot API methods the bot uses at /bot<token>/<method>"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, result, status: int = 200):
+        body = json.dumps({"ok": status == 200, "result": result}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        params = read_params(self)
+        if method == "getMe":
+            self.reply(BOT_USER)
+        elif method == "setWebhook":
+            state.webhook = (params["url"], params.get("secret_token", ""))
+            state.webhook_set.set()
+            self.reply(True)
+        elif method in ("sendMessage", "editMessageText"):
+            self.reply(state.record_message(params))
+        else:
+            self.reply(True)
+
+    do_GET = do_POST
+
+def post_update(url: str, secret: str, update) -> int:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def start_update(update_id: int, user_id: int):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]
+        }
+    }
+
+def wait_for_webhook(url: str, timeout: float):
+    """Wait until the bot's ASGI app answers its health check"""
+    parts = urlsplit(url)
+    health_url = f"{parts.scheme}://{parts.netloc}/health"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(health_url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Webhook at {url} did not come up within {timeout:.0f}s")
+
+def run_check(users: int, timeout: float) -> bool:
+    if not state.webhook_set.wait(timeout):
+        print("FAIL: the bot never called setWebhook")
+        return False
+    url, secret = state.webhook
+    print(f"Webhook registered at {url}")
+    wait_for_webhook(url, timeout)
+
+    ok = True
+    rejected = post_update(url, secret + "-wrong", start_update(1, 0))
+    if rejected != 403:
+        print(f"FAIL: wrong secret token answered {rejected}, expected 403")
+        ok = False
+
+    started = time.monotonic()
+    statuses = [post_update(url, secret, start_update(user_id + 1, user_id)) for user_id in range(1, users + 1)]
+    if any(status != 200 for status in statuses):
+        print(f"FAIL: webhook answered {sorted(set(statuses))}, expected 200")
+        ok = False
+
+    deadline = started + timeout
+    def answered():
+        return len(state.sent) - (0 in state.sent)
+    while time.monotonic() < deadline and answered() < users:
+        time.sleep(0.05)
+    print(f"{answered()}/{users} users answered in {time.monotonic() - started:.2f}s")
+    if answered() < users:
+        print("FAIL: not every user got the welcome message")
+        ok = False
+    if 0 in state.sent:
+        print("FAIL: the bot answered the update with the wrong secret token")
+        ok = False
+    print("PASS" if ok else "FAIL")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for testing webhook mode")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=10, help="Distinct users sending /start")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the bot at each step")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeTelegramHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Fake Telegram API on http://127.0.0.1:{args.port}")
+    try:
+        ok = run_check(args.users, args.timeout)
+    finally:
+        server.shutdown()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
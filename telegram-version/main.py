@@ -1,16 +1,39 @@
 import os
 import logging
-import tempfile
 import json
 import base64
-import requests
+import asyncio
+import time
+import argparse
+import hmac
+import sqlite3
+import sys
+import threading
+import uuid
+import httpx
 import cv2
 import numpy as np
+import uvicorn
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+
+# Helpers shared by the services live in zkyc_common at the repo root; images copy it next to main.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, HTTPException, Request
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from zkyc_common.inference import InferenceExecutor
+from zkyc_common.weights import verify_weight_bundle, write_weight_manifest
+
+# DeepFace looks for weights under $DEEPFACE_HOME/.deepface/weights, so point it
+# at the local weight bundle before the library is imported
+MODEL_WEIGHTS_DIR = os.getenv("MODEL_WEIGHTS_DIR")
+if MODEL_WEIGHTS_DIR:
+    os.environ.setdefault("DEEPFACE_HOME", MODEL_WEIGHTS_DIR)
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
 from deepface import DeepFace
 
 # Configure logging
@@ -24,20 +47,414 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("TOKEN")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 QWEN_MODEL = "qwen2.5vl:3b"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# Serving mode: "polling" long-polls Telegram from a single process, "webhook" serves an
+# ASGI endpoint that Telegram posts updates to, from WEBHOOK_WORKERS processes
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # public base URL Telegram can reach
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Largest photo the bot will download and hold in memory
+MAX_PHOTO_BYTES = int(os.getenv("MAX_PHOTO_BYTES", str(10 * 1024 * 1024)))
+
+# Smallest photo each step needs, as the longest side in pixels; the bot downloads the
+# smallest size Telegram offers that reaches it. Faces are resized to ~160-224 px by
+# DeepFace, while the VLM needs more pixels to read the text on an ID card.
+PHOTO_MIN_SIDE_ID = int(os.getenv("PHOTO_MIN_SIDE_ID", "1280"))
+PHOTO_MIN_SIDE_SELFIE = int(os.getenv("PHOTO_MIN_SIDE_SELFIE", "640"))
+PHOTO_MIN_SIDE_FACE = int(os.getenv("PHOTO_MIN_SIDE_FACE", "800"))
+PHOTO_MIN_SIDE = {
+    'waiting_for_document': PHOTO_MIN_SIDE_ID,
+    'waiting_for_first_face': PHOTO_MIN_SIDE_FACE,
+    'waiting_for_second_face': PHOTO_MIN_SIDE_FACE,
+    'waiting_for_id_card': PHOTO_MIN_SIDE_ID,
+    'waiting_for_selfie': PHOTO_MIN_SIDE_SELFIE,
+}
+
+# Concurrency: updates processed at once across all users, and threads for blocking inference
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Conversation sessions: "memory" keeps them in this process, "sqlite" shares them
+# between bot processes through SESSION_DB_PATH
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))  # seconds of inactivity before a session is dropped
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "1000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+# Webhook processes sharing the sqlite backend take turns per user through it; a process that
+# stops renewing its turns (crashed) loses its place after SESSION_TURN_LEASE seconds
+SESSION_TURN_LEASE = float(os.getenv("SESSION_TURN_LEASE", "30"))
+SESSION_TURN_POLL = 0.05
+
+def warm_up_models(prepare: bool = False) -> None:
+    """Load the face model and detector, then run one dummy verification to warm them up"""
+    if MODEL_WEIGHTS_DIR and not prepare:
+        verify_weight_bundle(MODEL_WEIGHTS_DIR)
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    DeepFace.verify(img1_path=dummy, img2_path=dummy, enforce_detection=False)
+
+# Bounded pool for DeepFace calls, so inference never blocks the event loop
+inference_executor = InferenceExecutor(INFERENCE_WORKERS)
+
+# Shared Ollama client, opened in post_init and closed in post_shutdown
+ollama_client: Optional[httpx.AsyncClient] = None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different users concurrently, up to max_concurrent_updates,
+    while each user's own updates still run one at a time and in order"""
+    
+    def __init__(self, max_concurrent_updates: int):
+        # The base class takes its concurrency slot before do_process_update, so an update
+        # waiting behind its own user's lock would hold one. Its limit is lifted and slots
+        # are taken here instead, once the user's lock is held.
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._users: Dict[int, int] = {}
+    
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+        turn = session_turns.pop(update.update_id, None)
+        if turn is not None:
+            # The shared turn order already covers this process's own updates
+            try:
+                await wait_for_turn(user.id, turn)
+                async with self._slots:
+                    await coroutine
+            finally:
+                await asyncio.to_thread(sessions.end_turn, turn)
+            return
+        lock = self._locks.setdefault(user.id, asyncio.Lock())
+        self._users[user.id] = self._users.get(user.id, 0) + 1
+        try:
+            async with lock, self._slots:
+                await coroutine
+        finally:
+            # Drop the lock once no update from this user is pending
+            self._users[user.id] -= 1
+            if not self._users[user.id]:
+                del self._users[user.id]
+                del self._locks[user.id]
+    
+    async def initialize(self) -> None:
+        pass
+    
+    async def shutdown(self) -> None:
+        pass
+
+class MemorySessionStore:
+    """Per-user conversation state and the file_ids of its photos, in this process.
+    Sessions expire after `ttl` seconds without an update; past `max_users` the least
+    recently updated session is evicted."""
+    
+    def __init__(self, ttl: float, max_users: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._sessions: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._sessions[user_id]
+                return None
+            return entry[1]
+    
+    def set(self, user_id: int, state: str, photos: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._sessions.pop(user_id, None)
+            self._sessions[user_id] = (time.time(), {"state": state, "photos": photos or {}})
+            while len(self._sessions) > self.max_users:
+                self._sessions.popitem(last=False)
+    
+    def delete(self, user_id: int) -> None:
+        with self._lock:
+            self._sessions.pop(user_id, None)
+    
+    def sweep(self) -> int:
+        """Drop expired sessions; returns how many were dropped"""
+        cutoff = time.time() - self.ttl
+        dropped = 0
+        with self._lock:
+            # Sessions are kept in update order, so expired ones are at the front
+            while self._sessions:
+                user_id, (updated_at, _) = next(iter(self._sessions.items()))
+                if updated_at >= cutoff:
+                    break
+                del self._sessions[user_id]
+                dropped += 1
+        return dropped
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    # Only this process uses the store, and PerUserUpdateProcessor already orders each user's updates
+    def take_turn(self, user_id: int) -> Optional[int]:
+        return None
+    
+    def is_turn(self, user_id: int, turn: int) -> bool:
+        return True
+    
+    def end_turn(self, turn: int) -> None:
+        pass
+    
+    def renew_turns(self) -> None:
+        pass
+    
+    def close(self) -> None:
+        self._sessions.clear()
+
+class SQLiteSessionStore:
+    """Per-user conversation state and the file_ids of its photos in a SQLite file, so several
+    bot processes share sessions.
+    Processes also queue for each user's turns here, so a user's updates run one at a time
+    and in arrival order whichever process received them."""
+    
+    def __init__(self, path: str, ttl: float, max_users: int, turn_lease: float):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.turn_lease = turn_lease
+        self._owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        # Sessions used to hold the photo bytes themselves
+        self._db.execute("DROP TABLE IF EXISTS session_photos")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_files ("
+            "user_id INTEGER NOT NULL REFERENCES sessions (user_id) ON DELETE CASCADE, "
+            "name TEXT NOT NULL, file_id TEXT NOT NULL, PRIMARY KEY (user_id, name))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS session_turns ("
+            "turn INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+            "owner TEXT NOT NULL, lease_expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS session_turns_user_id ON session_turns (user_id, turn)")
+    
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM sessions WHERE user_id = ? AND updated_at >= ?",
+                (user_id, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            photos = self._db.execute(
+                "SELECT name, file_id FROM session_files WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        return {"state": row[0], "photos": dict(photos)}
+    
+    def set(self, user_id: int, state: str, photos: Optional[Dict[str, str]] = None) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+                self._db.execute(
+                    "INSERT INTO sessions (user_id, state, updated_at) VALUES (?, ?, ?)",
+                    (user_id, state, time.time())
+                )
+                self._db.executemany(
+                    "INSERT INTO session_files (user_id, name, file_id) VALUES (?, ?, ?)",
+                    [(user_id, name, file_id) for name, file_id in (photos or {}).items()]
+                )
+                # Evict the least recently updated sessions past the cap
+                self._db.execute(
+                    "DELETE FROM sessions WHERE user_id IN "
+                    "(SELECT user_id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_users,)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+    
+    def delete(self, user_id: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+    
+    def sweep(self) -> int:
+        """Drop expired sessions and abandoned turns; returns how many sessions were dropped"""
+        with self._lock:
+            self._db.execute("DELETE FROM session_turns WHERE lease_expires_at < ?", (time.time(),))
+            return self._db.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    
+    def take_turn(self, user_id: int) -> Optional[int]:
+        """Queue for the user's next turn, behind every turn already taken by any process"""
+        with self._lock:
+            return self._db.execute(
+                "INSERT INTO session_turns (user_id, owner, lease_expires_at) VALUES (?, ?, ?)",
+                (user_id, self._owner, time.time() + self.turn_lease)
+            ).lastrowid
+    
+    def is_turn(self, user_id: int, turn: int) -> bool:
+        """Whether every earlier turn of the user has ended or its lease has run out"""
+        with self._lock:
+            first = self._db.execute(
+                "SELECT MIN(turn) FROM session_turns WHERE user_id = ? AND lease_expires_at >= ?",
+                (user_id, time.time())
+            ).fetchone()[0]
+        return first is None or first >= turn
+    
+    def end_turn(self, turn: int) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM session_turns WHERE turn = ?", (turn,))
+    
+    def renew_turns(self) -> None:
+        """Extend the leases of this process's turns, waiting or running"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE session_turns SET lease_expires_at = ? WHERE owner = ?",
+                (time.time() + self.turn_lease, self._owner)
+            )
+    
+    def close(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM session_turns WHERE owner = ?", (self._owner,))
+            self._db.close()
+
+def create_session_store():
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore(SESSION_TTL, SESSION_MAX_USERS)
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH, SESSION_TTL, SESSION_MAX_USERS, SESSION_TURN_LEASE)
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+
+# Session store and its sweeper and turn renewer, started in post_init
+sessions = None
+session_sweeper: Optional[asyncio.Task] = None
+turn_renewer: Optional[asyncio.Task] = None
+
+# Turn taken by the webhook for each queued update, by update_id
+session_turns: Dict[int, int] = {}
+
+async def get_session(user_id: int) -> Optional[Dict[str, Any]]:
+    return await asyncio.to_thread(sessions.get, user_id)
 
-# User states
-USER_STATES = {}
-USER_DATA = {}
+async def set_session(user_id: int, state: str, **photos: str) -> None:
+    await asyncio.to_thread(sessions.set, user_id, state, photos)
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Convert image to base64 string for Ollama"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+async def clear_session(user_id: int) -> None:
+    await asyncio.to_thread(sessions.delete, user_id)
 
-def query_qwen_vision(image_path: str, prompt: str) -> str:
-    """Query Qwen2.5 VLM via Ollama"""
+async def sweep_sessions() -> None:
+    """Periodically drop sessions from users who never finished a flow"""
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            dropped = await asyncio.to_thread(sessions.sweep)
+            if dropped:
+                logger.info(f"🧹 Dropped {dropped} expired sessions")
+        except Exception as e:
+            logger.error(f"Session sweep failed: {str(e)}")
+
+async def wait_for_turn(user_id: int, turn: int) -> None:
+    """Wait until the user's earlier updates, received by any process, are done"""
+    while not await asyncio.to_thread(sessions.is_turn, user_id, turn):
+        await asyncio.sleep(SESSION_TURN_POLL)
+
+async def renew_turns() -> None:
+    """Keep this process's turns from being taken over while it is alive"""
+    while True:
+        await asyncio.sleep(SESSION_TURN_LEASE / 3)
+        try:
+            await asyncio.to_thread(sessions.renew_turns)
+        except Exception as e:
+            logger.error(f"Turn renewal failed: {str(e)}")
+
+async def post_init(application: Application) -> None:
+    """Open the Ollama client and the session store, and warm up the models before the bot starts taking updates."""
+    global ollama_client, sessions, session_sweeper, turn_renewer
+    ollama_client = httpx.AsyncClient(base_url=OLLAMA_BASE_URL, timeout=OLLAMA_TIMEOUT)
+    sessions = create_session_store()
+    session_sweeper = asyncio.create_task(sweep_sessions())
+    turn_renewer = asyncio.create_task(renew_turns())
+    logger.info("🔥 Warming up face recognition models...")
+    start = time.monotonic()
+    await inference_executor.run(warm_up_models)
+    logger.info(f"✅ Models ready in {time.monotonic() - start:.1f}s")
+
+async def post_shutdown(application: Application) -> None:
+    """Close the Ollama client, the session store and the inference pool."""
+    if ollama_client is not None:
+        await ollama_client.aclose()
+    if session_sweeper is not None:
+        session_sweeper.cancel()
+    if turn_renewer is not None:
+        turn_renewer.cancel()
+    if sessions is not None:
+        sessions.close()
+    inference_executor.shutdown()
+
+def encode_image_to_base64(image_bytes: bytes) -> str:
+    """Convert image bytes to base64 string for Ollama"""
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """Decode photo bytes into the BGR array DeepFace expects"""
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode the image")
+    return img
+
+def verify_face_images(img1_bytes: bytes, img2_bytes: bytes) -> Dict[str, Any]:
+    """Decode both photos once and compare their faces"""
+    return DeepFace.verify(
+        img1_path=decode_image(img1_bytes),
+        img2_path=decode_image(img2_bytes),
+        enforce_detection=False
+    )
+
+def select_photo_size(sizes, min_side: int):
+    """Smallest PhotoSize whose longest side reaches min_side, or the largest one if none does"""
+    by_area = sorted(sizes, key=lambda size: size.width * size.height)
+    for size in by_area:
+        if max(size.width, size.height) >= min_side:
+            return size
+    return by_area[-1]
+
+def check_photo_size(file_size: Optional[int]) -> None:
+    if file_size and file_size > MAX_PHOTO_BYTES:
+        raise ValueError(f"Photo is larger than {MAX_PHOTO_BYTES // (1024 * 1024)} MB")
+
+async def download_photo(bot: Bot, file_id: str) -> bytes:
+    """Download a Telegram photo into memory"""
+    photo_file = await bot.get_file(file_id)
+    check_photo_size(photo_file.file_size)
+    return bytes(await photo_file.download_as_bytearray())
+
+async def query_qwen_vision(image_bytes: bytes, prompt: str) -> str:
+    """Query Qwen2.5 VLM via Ollama without blocking the event loop"""
     try:
-        image_base64 = encode_image_to_base64(image_path)
+        image_base64 = encode_image_to_base64(image_bytes)
         
         payload = {
             "model": QWEN_MODEL,
@@ -46,11 +463,7 @@ def query_qwen_vision(image_path: str, prompt: str) -> str:
             "stream": False
         }
         
-        response = requests.post(
-            f"{OLLAMA_BASE_URL}/api/generate",
-            json=payload,
-            timeout=60
-        )
+        response = await ollama_client.post("/api/generate", json=payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -98,7 +511,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     
     if query.data == 'extract_text':
-        USER_STATES[user_id] = 'waiting_for_document'
+        await set_session(user_id, 'waiting_for_document')
         await query.edit_message_text(
             "📸 <b>Text Extraction Mode</b>\n\n"
             "Please send me a photo of your ID document or any document with text.\n"
@@ -108,7 +521,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
     
     elif query.data == 'face_recognition':
-        USER_STATES[user_id] = 'waiting_for_first_face'
+        await set_session(user_id, 'waiting_for_first_face')
         await query.edit_message_text(
             "👤 <b>Face Recognition Mode</b>\n\n"
             "I'll help you compare faces between two photos.\n\n"
@@ -117,7 +530,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
     
     elif query.data == 'full_kyc':
-        USER_STATES[user_id] = 'waiting_for_id_card'
+        await set_session(user_id, 'waiting_for_id_card')
         await query.edit_message_text(
             "🏛️ <b>Full KYC Verification</b>\n\n"
             "I'll perform complete identity verification by:\n"
@@ -190,7 +603,8 @@ Choose what you'd like to do:
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle photo uploads based on user state."""
     user_id = update.effective_user.id
-    state = USER_STATES.get(user_id, None)
+    session = await get_session(user_id)
+    state = session["state"] if session else None
     
     if not state:
         await update.message.reply_text(
@@ -199,50 +613,44 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
         return
     
-    # Download the photo
-    photo = update.message.photo[-1]  # Get highest resolution
-    photo_file = await photo.get_file()
-    
-    # Create temporary file
-    temp_dir = tempfile.mkdtemp()
-    photo_path = os.path.join(temp_dir, f"photo_{user_id}_{datetime.now().timestamp()}.jpg")
-    await photo_file.download_to_drive(photo_path)
-    
     try:
+        # Sessions keep only the file_id of a photo for a later step; photos are downloaded
+        # into memory once the step that uses them runs
+        photo = select_photo_size(update.message.photo, PHOTO_MIN_SIDE[state])
+        check_photo_size(photo.file_size)
+        
         if state == 'waiting_for_document':
-            await process_document_extraction(update, photo_path)
+            await process_document_extraction(update, await download_photo(context.bot, photo.file_id))
             
         elif state == 'waiting_for_first_face':
-            USER_DATA[user_id] = {'first_photo': photo_path}
-            USER_STATES[user_id] = 'waiting_for_second_face'
+            await set_session(user_id, 'waiting_for_second_face', first_photo=photo.file_id)
             await update.message.reply_text(
                 "✅ <b>First photo received!</b>\n\n"
                 "📸 <b>Step 2:</b> Now send me the second photo to compare",
                 parse_mode='HTML'
             )
-            return  # Don't clean up yet, we need the file
             
         elif state == 'waiting_for_second_face':
-            first_photo = USER_DATA[user_id]['first_photo']
-            await process_face_comparison(update, first_photo, photo_path)
+            first_photo, second_photo = await asyncio.gather(
+                download_photo(context.bot, session["photos"]['first_photo']),
+                download_photo(context.bot, photo.file_id)
+            )
+            await process_face_comparison(update, first_photo, second_photo)
             
         elif state == 'waiting_for_id_card':
-            USER_DATA[user_id] = {'id_card': photo_path}
-            USER_STATES[user_id] = 'waiting_for_selfie'
+            await set_session(user_id, 'waiting_for_selfie', id_card=photo.file_id)
             await update.message.reply_text(
                 "✅ <b>ID card received!</b>\n\n"
                 "📸 <b>Step 2:</b> Now send me a selfie photo for face verification",
                 parse_mode='HTML'
             )
-            return  # Don't clean up yet, we need the file
             
         elif state == 'waiting_for_selfie':
-            id_card_path = USER_DATA[user_id]['id_card']
-            # Store selfie path for cleanup after verification
-            USER_DATA[user_id]['selfie_path'] = photo_path
-            USER_DATA[user_id]['selfie_temp_dir'] = temp_dir
-            await process_kyc_verification(update, id_card_path, photo_path)
-            return  # Don't clean up yet, process_kyc_verification will handle it
+            id_card, selfie = await asyncio.gather(
+                download_photo(context.bot, session["photos"]['id_card']),
+                download_photo(context.bot, photo.file_id)
+            )
+            await process_kyc_verification(update, id_card, selfie)
     
     except Exception as e:
         logger.error(f"Error processing photo: {str(e)}")
@@ -252,19 +660,11 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         )
     
     finally:
-        # Clean up (only for states that don't need deferred cleanup)
-        if state not in ['waiting_for_first_face', 'waiting_for_id_card', 'waiting_for_selfie']:
-            if os.path.exists(photo_path):
-                os.remove(photo_path)
-            if os.path.exists(temp_dir):
-                os.rmdir(temp_dir)
-        
-        # Reset user state if needed
-        if state in ['waiting_for_document', 'waiting_for_second_face']:
-            USER_STATES.pop(user_id, None)
-            USER_DATA.pop(user_id, None)
+        # Reset user state once a flow has finished
+        if state in ['waiting_for_document', 'waiting_for_second_face', 'waiting_for_selfie']:
+            await clear_session(user_id)
 
-async def process_document_extraction(update: Update, image_path: str) -> None:
+async def process_document_extraction(update: Update, image_bytes: bytes) -> None:
     """Process document text extraction."""
     await update.message.reply_text("🤖 <b>Analyzing document with AI...</b>\nThis may take a few seconds...", parse_mode='HTML')
     
@@ -278,7 +678,7 @@ async def process_document_extraction(update: Update, image_path: str) -> None:
     
     Format the response in a clear, structured way."""
     
-    extracted_text = query_qwen_vision(image_path, prompt)
+    extracted_text = await query_qwen_vision(image_bytes, prompt)
     
     response = f"""
 ✅ <b>Document Analysis Complete!</b>
@@ -293,17 +693,13 @@ Use /start to perform another operation.
     
     await update.message.reply_text(response, parse_mode='HTML')
 
-async def process_face_comparison(update: Update, first_photo: str, second_photo: str) -> None:
+async def process_face_comparison(update: Update, first_photo: bytes, second_photo: bytes) -> None:
     """Process face recognition between two photos."""
     user_id = update.effective_user.id
     await update.message.reply_text("👤 <b>Comparing faces with AI...</b>\nThis may take a moment...", parse_mode='HTML')
     
     try:
-        result = DeepFace.verify(
-            img1_path=first_photo, 
-            img2_path=second_photo,
-            enforce_detection=False
-        )
+        result = await inference_executor.run(verify_face_images, first_photo, second_photo)
         
         verified = result["verified"]
         confidence = 1.0 - result["distance"]
@@ -335,21 +731,10 @@ Use /start to perform another operation.
         )
     
     finally:
-        # Clean up first photo
-        if os.path.exists(first_photo):
-            os.remove(first_photo)
-        first_photo_dir = os.path.dirname(first_photo)
-        if os.path.exists(first_photo_dir):
-            try:
-                os.rmdir(first_photo_dir)
-            except OSError:
-                pass  # Directory not empty
-        
         # Reset user state and data
-        USER_STATES.pop(user_id, None)
-        USER_DATA.pop(user_id, None)
+        await clear_session(user_id)
 
-async def process_kyc_verification(update: Update, id_card_path: str, selfie_path: str) -> None:
+async def process_kyc_verification(update: Update, id_card: bytes, selfie: bytes) -> None:
     """Process full KYC verification."""
     user_id = update.effective_user.id
     await update.message.reply_text("🏛️ <b>Performing KYC verification...</b>\nThis may take up to 30 seconds...", parse_mode='HTML')
@@ -366,13 +751,10 @@ async def process_kyc_verification(update: Update, id_card_path: str, selfie_pat
         
         Format as clear, structured text."""
         
-        extracted_info = query_qwen_vision(id_card_path, id_prompt)
-        
-        # 2. Face verification
-        face_result = DeepFace.verify(
-            img1_path=id_card_path,
-            img2_path=selfie_path,
-            enforce_detection=False
+        # 2. Face verification, run in parallel with the extraction
+        extracted_info, face_result = await asyncio.gather(
+            query_qwen_vision(id_card, id_prompt),
+            inference_executor.run(verify_face_images, id_card, selfie)
         )
         
         verified = face_result["verified"]
@@ -415,76 +797,15 @@ Use /start to perform another verification.
         )
     
     finally:
-        # Clean up both files and directories
-        user_data = USER_DATA.get(user_id, {})
-        
-        # Clean up ID card
-        if os.path.exists(id_card_path):
-            os.remove(id_card_path)
-        id_card_dir = os.path.dirname(id_card_path)
-        if os.path.exists(id_card_dir):
-            try:
-                os.rmdir(id_card_dir)
-            except OSError:
-                pass  # Directory not empty
-        
-        # Clean up selfie
-        if os.path.exists(selfie_path):
-            os.remove(selfie_path)
-        selfie_temp_dir = user_data.get('selfie_temp_dir')
-        if selfie_temp_dir and os.path.exists(selfie_temp_dir):
-            try:
-                os.rmdir(selfie_temp_dir)
-            except OSError:
-                pass  # Directory not empty
-        
         # Reset user state and data
-        USER_STATES.pop(user_id, None)
-        USER_DATA.pop(user_id, None)
+        await clear_session(user_id)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Cancel current operation."""
     user_id = update.effective_user.id
     
-    # Clean up any temporary files
-    user_data = USER_DATA.get(user_id, {})
-    
-    # Clean up first photo (from face comparison)
-    first_photo = user_data.get('first_photo')
-    if first_photo and os.path.exists(first_photo):
-        os.remove(first_photo)
-        first_photo_dir = os.path.dirname(first_photo)
-        if os.path.exists(first_photo_dir):
-            try:
-                os.rmdir(first_photo_dir)
-            except OSError:
-                pass
-    
-    # Clean up ID card
-    id_card = user_data.get('id_card')
-    if id_card and os.path.exists(id_card):
-        os.remove(id_card)
-        id_card_dir = os.path.dirname(id_card)
-        if os.path.exists(id_card_dir):
-            try:
-                os.rmdir(id_card_dir)
-            except OSError:
-                pass
-    
-    # Clean up selfie
-    selfie_path = user_data.get('selfie_path')
-    if selfie_path and os.path.exists(selfie_path):
-        os.remove(selfie_path)
-    
-    selfie_temp_dir = user_data.get('selfie_temp_dir')
-    if selfie_temp_dir and os.path.exists(selfie_temp_dir):
-        try:
-            os.rmdir(selfie_temp_dir)
-        except OSError:
-            pass
-    
-    USER_STATES.pop(user_id, None)
-    USER_DATA.pop(user_id, None)
+    # Drop any photos held for an unfinished flow
+    await clear_session(user_id)
     
     await update.message.reply_text(
         "❌ <b>Operation cancelled.</b>\n\nUse /start to begin a new operation."
@@ -527,6 +848,114 @@ Use <code>/start</code> to begin using the bot!
     
     await update.message.reply_text(help_text, parse_mode='HTML')
 
+def build_application(webhook: bool = False) -> Application:
+    """Build the bot with all of its handlers; webhook bots take updates from the ASGI app instead of an updater"""
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
+    
+    # Command handlers
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("cancel", cancel))
+    
+    # Callback handlers
+    application.add_handler(CallbackQueryHandler(button_handler))
+    
+    # Photo handler
+    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    
+    return application
+
+def create_webhook_app() -> FastAPI:
+    """ASGI app for webhook mode; every worker process builds its own bot"""
+    # uvicorn can load this factory directly, so don't rely on run_webhook's check: without a
+    # secret the comparison below would accept any caller
+    if not WEBHOOK_SECRET_TOKEN:
+        raise RuntimeError("WEBHOOK_SECRET_TOKEN is required in webhook mode")
+    application = build_application(webhook=True)
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await application.initialize()
+        await post_init(application)
+        await application.start()
+        try:
+            yield
+        finally:
+            await application.stop()
+            await application.shutdown()
+            await post_shutdown(application)
+    
+    app = FastAPI(title="ZKYC Telegram Bot", lifespan=lifespan)
+    
+    @app.post(WEBHOOK_PATH)
+    async def telegram_webhook(request: Request):
+        """Queue an update posted by Telegram; it is processed after the response is sent"""
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Invalid secret token")
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid update")
+        if update.effective_user is not None:
+            # Take the user's turn on arrival, so their updates keep this order across processes
+            turn = await asyncio.to_thread(sessions.take_turn, update.effective_user.id)
+            if turn is not None:
+                session_turns[update.update_id] = turn
+        await application.update_queue.put(update)
+        return {"ok": True}
+    
+    @app.get("/health")
+    async def health_check():
+        return {
+            "status": "healthy",
+            "mode": "webhook",
+            "pending_updates": application.update_queue.qsize(),
+            "inference": inference_executor.stats()
+        }
+    
+    return app
+
+async def register_webhook() -> None:
+    """Point Telegram at WEBHOOK_URL; done once, before the worker processes start"""
+    bot = Bot(BOT_TOKEN, base_url=f"{TELEGRAM_API_URL}/bot", base_file_url=f"{TELEGRAM_API_URL}/file/bot")
+    async with bot:
+        await bot.set_webhook(
+            url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=["message", "callback_query"]
+        )
+
+def run_webhook() -> None:
+    if not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN:
+        logger.error("WEBHOOK_URL and WEBHOOK_SECRET_TOKEN are required in webhook mode!")
+        return
+    if WEBHOOK_WORKERS > 1 and SESSION_BACKEND == "memory":
+        logger.error("Webhook workers don't share in-memory sessions; set SESSION_BACKEND=sqlite to run several")
+        return
+    
+    asyncio.run(register_webhook())
+    logger.info(f"🚀 Serving webhook at {WEBHOOK_URL}{WEBHOOK_PATH} with {WEBHOOK_WORKERS} worker(s)...")
+    uvicorn.run(
+        "main:create_webhook_app",
+        factory=True,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        workers=WEBHOOK_WORKERS
+    )
+
 def main() -> None:
     """Start the bot."""
     logger.info("=== ZKYC Telegram Bot Starting ===")
@@ -540,7 +969,7 @@ def main() -> None:
     
     # Test Ollama connection
     try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        response = httpx.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
         if response.status_code == 200:
             logger.info("✅ Ollama connection successful")
         else:
@@ -548,18 +977,11 @@ def main() -> None:
     except Exception as e:
         logger.error(f"❌ Ollama connection failed: {str(e)}")
     
-    application = Application.builder().token(BOT_TOKEN).build()
-    
-    # Command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("cancel", cancel))
-    
-    # Callback handlers
-    application.add_handler(CallbackQueryHandler(button_handler))
+    if BOT_MODE == "webhook":
+        run_webhook()
+        return
     
-    # Photo handler
-    application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+    application = build_application()
     
     # Start the bot
     logger.info("🚀 Starting ZKYC Telegram Bot...")
@@ -570,4 +992,13 @@ def main() -> None:
         raise
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ZKYC Telegram Bot")
+    parser.add_argument("--prepare-weights", action="store_true", help="Download model weights into MODEL_WEIGHTS_DIR and write its checksum manifest")
+    args = parser.parse_args()
+    if args.prepare_weights:
+        if not MODEL_WEIGHTS_DIR:
+            parser.error("MODEL_WEIGHTS_DIR must be set to prepare the weight bundle")
+        warm_up_models(prepare=True)
+        write_weight_manifest(MODEL_WEIGHTS_DIR)
+    else:
+        main() 
\ No newline at end of file
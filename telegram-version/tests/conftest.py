@@ -0,0 +1,16 @@
+import importlib.util
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_module(name: str, filename: str):
+    """Import a file of this service under its own name, so the services' `main` modules
+    don't shadow each other when the whole repo is tested in one run"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SERVICE_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+load_module("telegram_main", "main.py")
@@ -0,0 +1,23 @@
+from collections import namedtuple
+
+from telegram_main import select_photo_size
+
+PhotoSize = namedtuple("PhotoSize", "width height")
+
+# Telegram lists a photo's sizes smallest first
+SIZES = [PhotoSize(90, 60), PhotoSize(320, 213), PhotoSize(800, 533), PhotoSize(1280, 853), PhotoSize(2560, 1706)]
+
+def test_smallest_size_reaching_min_side():
+    assert select_photo_size(SIZES, 640) == PhotoSize(800, 533)
+    assert select_photo_size(SIZES, 800) == PhotoSize(800, 533)
+    assert select_photo_size(SIZES, 801) == PhotoSize(1280, 853)
+
+def test_largest_size_when_none_reaches_min_side():
+    assert select_photo_size(SIZES, 4000) == PhotoSize(2560, 1706)
+
+def test_longest_side_is_used_for_portrait_photos():
+    portrait = [PhotoSize(height, width) for width, height in SIZES]
+    assert select_photo_size(portrait, 1280) == PhotoSize(853, 1280)
+
+def test_sizes_in_any_order():
+    assert select_photo_size(list(reversed(SIZES)), 640) == PhotoSize(800, 533)
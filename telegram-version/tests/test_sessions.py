@@ -0,0 +1,129 @@
+import pytest
+
+import telegram_main
+from telegram_main import MemorySessionStore, SQLiteSessionStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(telegram_main.time, "time", clock)
+    return clock
+
+def open_sqlite(tmp_path, ttl=60, max_users=10, turn_lease=30):
+    return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl, max_users, turn_lease)
+
+@pytest.fixture(params=["memory", "sqlite"])
+def open_store(request, tmp_path):
+    stores = []
+
+    def open_store(ttl=60, max_users=10):
+        if request.param == "memory":
+            store = MemorySessionStore(ttl, max_users)
+        else:
+            store = open_sqlite(tmp_path, ttl, max_users)
+        stores.append(store)
+        return store
+
+    yield open_store
+    for store in stores:
+        store.close()
+
+def test_set_get_delete(open_store, clock):
+    store = open_store()
+    assert store.get(1) is None
+    store.set(1, "waiting_selfie", {"id_card": "file-1"})
+    assert store.get(1) == {"state": "waiting_selfie", "photos": {"id_card": "file-1"}}
+    store.set(1, "waiting_id_card")
+    assert store.get(1) == {"state": "waiting_id_card", "photos": {}}
+    store.delete(1)
+    assert store.get(1) is None
+    assert len(store) == 0
+
+def test_sessions_expire_after_ttl(open_store, clock):
+    store = open_store(ttl=60)
+    store.set(1, "waiting_selfie")
+    clock.now += 60
+    assert store.get(1)["state"] == "waiting_selfie"
+    clock.now += 1
+    assert store.get(1) is None
+
+def test_least_recently_updated_session_is_evicted(open_store, clock):
+    store = open_store(max_users=2)
+    store.set(1, "a")
+    clock.now += 1
+    store.set(2, "b")
+    clock.now += 1
+    store.set(1, "c")
+    clock.now += 1
+    store.set(3, "d")
+    assert store.get(2) is None
+    assert (store.get(1)["state"], store.get(3)["state"]) == ("c", "d")
+    assert len(store) == 2
+
+def test_sweep_drops_expired_sessions(open_store, clock):
+    store = open_store(ttl=60)
+    store.set(1, "a")
+    clock.now += 30
+    store.set(2, "b")
+    clock.now += 31
+    assert store.sweep() == 1
+    assert store.get(1) is None
+    assert store.get(2)["state"] == "b"
+    assert store.sweep() == 0
+
+def test_memory_store_takes_no_turns():
+    store = MemorySessionStore(60, 10)
+    assert store.take_turn(1) is None
+    assert store.is_turn(1, 0)
+
+def test_sqlite_stores_share_sessions(tmp_path, clock):
+    first, second = open_sqlite(tmp_path), open_sqlite(tmp_path)
+    first.set(1, "waiting_second_face", {"first_face": "file-1"})
+    assert second.get(1) == {"state": "waiting_second_face", "photos": {"first_face": "file-1"}}
+    second.delete(1)
+    assert first.get(1) is None
+    first.close()
+    second.close()
+
+def test_turns_run_in_order_across_stores(tmp_path, clock):
+    first, second = open_sqlite(tmp_path), open_sqlite(tmp_path)
+    turn_1 = first.take_turn(1)
+    turn_2 = second.take_turn(1)
+    other_user = second.take_turn(2)
+    assert first.is_turn(1, turn_1)
+    assert not second.is_turn(1, turn_2)
+    assert second.is_turn(2, other_user)
+    first.end_turn(turn_1)
+    assert second.is_turn(1, turn_2)
+    first.close()
+    second.close()
+
+def test_expired_turns_stop_holding_back_later_ones(tmp_path, clock):
+    crashed, live = open_sqlite(tmp_path, turn_lease=30), open_sqlite(tmp_path, turn_lease=30)
+    crashed.take_turn(1)
+    waiting = live.take_turn(1)
+    clock.now += 20
+    live.renew_turns()
+    assert not live.is_turn(1, waiting)
+    clock.now += 11
+    assert live.is_turn(1, waiting)
+    # The renewed turn is still live, so the sweep only drops the crashed process's turn
+    live.sweep()
+    assert live._db.execute("SELECT turn FROM session_turns").fetchall() == [(waiting,)]
+    crashed.close()
+    live.close()
+
+def test_close_releases_the_owners_turns(tmp_path, clock):
+    first, second = open_sqlite(tmp_path), open_sqlite(tmp_path)
+    first.take_turn(1)
+    waiting = second.take_turn(1)
+    first.close()
+    assert second.is_turn(1, waiting)
+    second.close()
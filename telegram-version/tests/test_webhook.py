@@ -0,0 +1,24 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import telegram_main
+
+def test_webhook_app_requires_a_secret(monkeypatch):
+    monkeypatch.setattr(telegram_main, "WEBHOOK_SECRET_TOKEN", "")
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET_TOKEN"):
+        telegram_main.create_webhook_app()
+
+def test_webhook_rejects_a_wrong_secret(monkeypatch):
+    monkeypatch.setattr(telegram_main, "WEBHOOK_SECRET_TOKEN", "local-secret")
+    monkeypatch.setattr(telegram_main, "BOT_TOKEN", "123:test")
+    client = TestClient(telegram_main.create_webhook_app())
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": ""}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+        response = client.post(telegram_main.WEBHOOK_PATH, json={"update_id": 1}, headers=headers)
+        assert response.status_code == 403
+
+def test_health_reports_the_inference_pool(monkeypatch):
+    monkeypatch.setattr(telegram_main, "WEBHOOK_SECRET_TOKEN", "local-secret")
+    monkeypatch.setattr(telegram_main, "BOT_TOKEN", "123:test")
+    health = TestClient(telegram_main.create_webhook_app()).get("/health").json()
+    assert health["pending_updates"] == 0
+    assert (health["inference"]["workers"], health["inference"]["queue_depth"]) == (telegram_main.INFERENCE_WORKERS, 0)
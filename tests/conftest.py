@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests for the shared zkyc_common package, imported from the repo root as the services do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from zkyc_common.admission import AdmissionLimiter, AdmissionMiddleware, AdmissionRejected, admission_limiter
+
+def test_admits_up_to_concurrency_then_queues():
+    async def run():
+        limiter = AdmissionLimiter(concurrency=2, queue_size=1, max_wait=5)
+        await limiter.acquire()
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert (limiter.in_flight, limiter.waiting) == (2, 1)
+        limiter.release(0.1)
+        await waiter
+        stats = limiter.stats()
+        assert (stats["in_flight"], stats["queue_depth"], stats["admitted"]) == (2, 0, 3)
+    asyncio.run(run())
+
+def test_sheds_with_429_when_queue_is_full():
+    async def run():
+        limiter = AdmissionLimiter(concurrency=1, queue_size=1, max_wait=5)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        assert limiter.shed_queue_full == 1
+        waiter.cancel()
+    asyncio.run(run())
+
+def test_sheds_with_503_after_max_wait():
+    async def run():
+        limiter = AdmissionLimiter(concurrency=1, queue_size=4, max_wait=0.01)
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status_code == 503
+        assert (limiter.shed_timeout, limiter.waiting) == (1, 0)
+    asyncio.run(run())
+
+def test_retry_after_follows_service_time():
+    limiter = AdmissionLimiter(concurrency=2, queue_size=8, max_wait=5)
+    limiter.service_seconds = 4.0
+    limiter.waiting = 3
+    assert limiter.retry_after() == 8
+
+def test_limits_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("ADMISSION_CONCURRENCY_ID_VERIFY", "3")
+    monkeypatch.setenv("ADMISSION_QUEUE_ID_VERIFY", "7")
+    monkeypatch.setenv("ADMISSION_MAX_WAIT_ID_VERIFY", "1.5")
+    limiter = admission_limiter("id_verify", 2, 4)
+    assert (limiter.concurrency, limiter.queue_size, limiter.max_wait) == (3, 7, 1.5)
+    limiter = admission_limiter("ai_extract", 2, 4)
+    assert (limiter.concurrency, limiter.queue_size) == (2, 4)
+
+def test_middleware_rejects_with_retry_after():
+    limiter = AdmissionLimiter(concurrency=1, queue_size=0, max_wait=5)
+
+    async def endpoint(request):
+        return PlainTextResponse("ok")
+
+    app = Starlette(routes=[Route("/limited", endpoint, methods=["GET", "POST"])])
+    app.add_middleware(AdmissionMiddleware, routes={"/limited": limiter})
+    client = TestClient(app)
+    assert client.post("/limited").status_code == 200
+    assert limiter.in_flight == 0
+    limiter.semaphore = asyncio.Semaphore(0)
+    response = client.post("/limited")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    # Only POSTs are admission-controlled
+    assert client.get("/limited").status_code == 200
@@ -0,0 +1,58 @@
+from zkyc_common import cache
+from zkyc_common.cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_hit_and_miss_counts():
+    c = TTLCache(4, 60)
+    assert c.get("a") is None
+    c.put("a", 1)
+    assert c.get("a") == 1
+    assert c.get("a") == 1
+    stats = c.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (2, 1, 1)
+    assert stats["hit_ratio"] == 2 / 3
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    c = TTLCache(4, 10)
+    c.put("a", 1)
+    clock.now += 10
+    assert c.get("a") == 1
+    clock.now += 0.5
+    assert c.get("a") is None
+    stats = c.stats()
+    assert (stats["size"], stats["evictions"], stats["misses"]) == (0, 1, 1)
+
+def test_put_refreshes_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    c = TTLCache(4, 10)
+    c.put("a", 1)
+    clock.now += 8
+    c.put("a", 2)
+    clock.now += 8
+    assert c.get("a") == 2
+
+def test_least_recently_used_is_evicted():
+    c = TTLCache(2, 60)
+    c.put("a", 1)
+    c.put("b", 2)
+    assert c.get("a") == 1
+    c.put("c", 3)
+    assert c.get("b") is None
+    assert c.get("a") == 1
+    assert c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+def test_zero_size_disables_cache():
+    c = TTLCache(0, 60)
+    c.put("a", 1)
+    assert c.get("a") is None
+    assert c.stats()["size"] == 0
@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+
+from zkyc_common.inference import run_stages
+
+def test_run_stages_merges_results_by_name():
+    async def stage(value):
+        await asyncio.sleep(0)
+        return value
+
+    assert asyncio.run(run_stages(face=stage(1), text=stage("x"))) == {"face": 1, "text": "x"}
+
+def test_run_stages_cancels_the_other_stages_on_failure():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def failing():
+        raise ValueError("no face")
+
+    with pytest.raises(ValueError, match="no face"):
+        asyncio.run(run_stages(text=slow(), face=failing()))
+    assert cancelled == [True]
@@ -0,0 +1,6 @@
+"""
+Helpers shared by the ocr-version, qwen-version, tee and telegram-version services.
+
+Each service image copies this package next to its main.py; when a service runs from its own
+directory in the repo, main.py adds the repo root to sys.path to find it.
+"""
@@ -0,0 +1,117 @@
+import asyncio
+import math
+import os
+import time
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse
+
+# Admission control: per-endpoint concurrency limits with a bounded wait queue.
+# ADMISSION_CONCURRENCY_<ENDPOINT> / ADMISSION_QUEUE_<ENDPOINT> / ADMISSION_MAX_WAIT_<ENDPOINT> override the defaults
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionLimiter:
+    """
+    Runs at most `concurrency` requests at once and lets at most `queue_size` more wait for a slot.
+    Requests beyond the queue are shed with 429; requests that wait longer than max_wait get 503.
+    """
+    
+    def __init__(self, concurrency: int, queue_size: int, max_wait: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Moving average of request duration, used for the Retry-After hint
+        self.service_seconds = 1.0
+    
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_seconds * (self.waiting + 1) / self.concurrency))
+    
+    async def acquire(self):
+        start = time.monotonic()
+        if not self.semaphore.locked():
+            # A free slot is taken without suspending
+            await self.semaphore.acquire()
+        elif self.waiting >= self.queue_size:
+            self.shed_queue_full += 1
+            raise AdmissionRejected(429, "Too many requests in progress, retry later", self.retry_after())
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.shed_timeout += 1
+                raise AdmissionRejected(503, "Timed out waiting for capacity, retry later", self.retry_after())
+            finally:
+                self.waiting -= 1
+        waited = time.monotonic() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+        self.in_flight += 1
+    
+    def release(self, service_seconds: float):
+        self.in_flight -= 1
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * service_seconds
+        self.semaphore.release()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_wait_seconds": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.wait_seconds_max
+        }
+
+def admission_limiter(endpoint: str, concurrency: int, queue_size: int) -> AdmissionLimiter:
+    suffix = endpoint.upper()
+    return AdmissionLimiter(
+        int(os.getenv(f"ADMISSION_CONCURRENCY_{suffix}", concurrency)),
+        int(os.getenv(f"ADMISSION_QUEUE_{suffix}", queue_size)),
+        float(os.getenv(f"ADMISSION_MAX_WAIT_{suffix}", ADMISSION_MAX_WAIT))
+    )
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the path's limiter before the upload is read; the slot is held
+    until the response, streamed or not, has been sent
+    """
+    
+    def __init__(self, app, routes: Dict[str, AdmissionLimiter]):
+        self.app = app
+        self.routes = routes
+    
+    async def __call__(self, scope, receive, send):
+        limiter = self.routes.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await limiter.acquire()
+        except AdmissionRejected as e:
+            response = JSONResponse(status_code=e.status_code, content={"detail": e.detail}, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.monotonic() - start)
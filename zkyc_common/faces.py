@@ -0,0 +1,176 @@
+"""
+DeepFace face pipeline shared by the qwen-version and tee services: detection, batched embedding,
+a content-addressed embedding cache, verification and the startup warm-up behind /ready.
+
+Needs deepface 0.0.93 (deepface.modules). Services import this module after pointing DEEPFACE_HOME
+at their weight bundle, as DeepFace reads it on import.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+from deepface.modules import detection, preprocessing
+from deepface.modules.verification import find_threshold
+from fastapi import HTTPException
+
+from zkyc_common.cache import TTLCache
+from zkyc_common.inference import EmbeddingBatcher, InferenceExecutor
+from zkyc_common.metrics import MODEL_LOAD_SECONDS, observe_stage
+from zkyc_common.weights import verify_weight_bundle
+
+logger = logging.getLogger("uvicorn.error")
+
+@observe_stage("decode")
+def decode_image(contents: bytes) -> np.ndarray:
+    """Decode encoded image bytes into a BGR array without touching the filesystem"""
+    img = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    return img
+
+def find_distance(a: np.ndarray, b: np.ndarray, metric: str) -> float:
+    """Distance between two embeddings using DeepFace's metric names"""
+    if metric == "cosine":
+        return float(1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+    if metric == "euclidean":
+        return float(np.linalg.norm(a - b))
+    if metric == "euclidean_l2":
+        return float(np.linalg.norm(a / np.linalg.norm(a) - b / np.linalg.norm(b)))
+    raise ValueError(f"Unsupported distance metric: {metric}")
+
+class FacePipeline:
+    """Face detection, embedding and verification for one DeepFace model, detector and distance metric.
+    Embeddings are cached by image content hash and computed in micro-batches on the inference pool."""
+
+    def __init__(
+        self,
+        model_name: str,
+        detector_backend: str,
+        distance_metric: str,
+        executor: InferenceExecutor,
+        cache: TTLCache,
+        batch_size: int,
+        batch_wait_ms: float,
+        weights_dir: Optional[str] = None
+    ):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.distance_metric = distance_metric
+        self.executor = executor
+        self.cache = cache
+        self.batcher = EmbeddingBatcher(self.embed_batch, executor, batch_size, batch_wait_ms)
+        self.weights_dir = weights_dir
+        # Model warm-up state, reported by /ready
+        self.status: Dict[str, Any] = {"ready": False, "error": None, "load_seconds": None}
+
+    def cache_key(self, contents: bytes, enforce_detection: bool) -> str:
+        digest = hashlib.sha256(contents).hexdigest()
+        return f"{digest}:{self.model_name}:{self.detector_backend}:{enforce_detection}"
+
+    @observe_stage("face_detection")
+    def detect_faces(self, img: np.ndarray, enforce_detection: bool) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+        """Detect and align every face in an image, returning model-ready crops and their facial areas.
+        Mirrors the preprocessing DeepFace.represent applies before the forward pass."""
+        target_size = DeepFace.build_model(self.model_name).input_shape
+        img_objs = detection.extract_faces(
+            img_path=img,
+            detector_backend=self.detector_backend,
+            grayscale=False,
+            enforce_detection=enforce_detection,
+            align=True
+        )
+        faces = []
+        for img_obj in img_objs:
+            # rgb to bgr, as DeepFace.represent does
+            face = img_obj["face"][:, :, ::-1]
+            face = preprocessing.resize_image(img=face, target_size=(target_size[1], target_size[0]))
+            face = preprocessing.normalize_input(img=face, normalization="base")
+            faces.append((face[0], img_obj["facial_area"]))
+        return faces
+
+    @observe_stage("embedding")
+    def embed_batch(self, faces: np.ndarray) -> np.ndarray:
+        """Run one forward pass of the face model over a stacked batch of crops"""
+        model = DeepFace.build_model(self.model_name)
+        if "keras" not in str(type(model.model)):
+            return np.stack([np.asarray(model.forward(face[np.newaxis])) for face in faces])
+        embeddings = model.model(faces, training=False).numpy()
+        if self.model_name == "VGG-Face":
+            # VGG-Face's forward() l2-normalises its output
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings
+
+    async def get_face_embeddings(self, contents: bytes, img: Optional[np.ndarray] = None, enforce_detection: bool = False) -> List[Dict[str, Any]]:
+        """Return cached face embeddings for an image, computing them on a cache miss"""
+        key = self.cache_key(contents, enforce_detection)
+        faces = self.cache.get(key)
+        if faces is None:
+            if img is None:
+                img = await asyncio.to_thread(decode_image, contents)
+            detected = await self.executor.run(self.detect_faces, img, enforce_detection)
+            embeddings = await self.batcher.embed([face for face, _ in detected])
+            faces = [
+                {"embedding": np.asarray(embedding, dtype=np.float32), "facial_area": facial_area}
+                for embedding, (_, facial_area) in zip(embeddings, detected)
+            ]
+            self.cache.put(key, faces)
+        return faces
+
+    async def verify_faces(
+        self,
+        img1_bytes: bytes,
+        img2_bytes: bytes,
+        img1: Optional[np.ndarray] = None,
+        img2: Optional[np.ndarray] = None,
+        enforce_detection: bool = False
+    ) -> Dict[str, Any]:
+        """Compare the closest pair of faces from two images, returning a DeepFace.verify-shaped result"""
+        faces1, faces2 = await asyncio.gather(
+            self.get_face_embeddings(img1_bytes, img1, enforce_detection),
+            self.get_face_embeddings(img2_bytes, img2, enforce_detection),
+        )
+        distance, face1, face2 = min(
+            ((find_distance(f1["embedding"], f2["embedding"], self.distance_metric), f1, f2) for f1 in faces1 for f2 in faces2),
+            key=lambda match: match[0]
+        )
+        threshold = float(find_threshold(self.model_name, self.distance_metric))
+        return {
+            "verified": distance <= threshold,
+            "distance": distance,
+            "threshold": threshold,
+            "model": self.model_name,
+            "detector_backend": self.detector_backend,
+            "similarity_metric": self.distance_metric,
+            "facial_areas": {"img1": face1["facial_area"], "img2": face2["facial_area"]}
+        }
+
+    def require_ready(self):
+        """Reject inference requests until the startup warm-up has finished"""
+        if not self.status["ready"]:
+            detail = f"Model warm-up failed: {self.status['error']}" if self.status["error"] else "Models are still loading"
+            raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "10"})
+
+    def warm_up(self, prepare: bool = False) -> None:
+        """Load the face model and detector, then run one dummy inference"""
+        if self.weights_dir and not prepare:
+            verify_weight_bundle(self.weights_dir)
+        dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+        self.embed_batch(np.stack([face for face, _ in self.detect_faces(dummy, enforce_detection=False)]))
+
+    async def warm_up_in_background(self):
+        """Warm up the models without holding up server startup; /ready flips once done"""
+        start = time.monotonic()
+        try:
+            await self.executor.run(self.warm_up)
+            self.status["load_seconds"] = time.monotonic() - start
+            MODEL_LOAD_SECONDS.set(self.status["load_seconds"])
+            self.status["ready"] = True
+            logger.info(f"Models ready in {self.status['load_seconds']:.1f}s")
+        except Exception as e:
+            self.status["error"] = str(e)
+            logger.error(f"Model warm-up failed: {str(e)}")
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+class InferenceExecutor:
+    """Bounded thread pool for blocking model calls, with queue-depth and utilisation counters"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def _run(self, fn, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.active -= 1
+                self.busy_seconds += elapsed
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def _on_done(self, future):
+        # Work cancelled while still queued never reaches _run
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking call on the pool and await its result"""
+        with self._lock:
+            self.queued += 1
+        future = self._pool.submit(self._run, fn, args, kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            uptime = time.monotonic() - self._started_at
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "utilisation": self.active / self.max_workers,
+                "busy_ratio": self.busy_seconds / (uptime * self.max_workers) if uptime > 0 else 0.0,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+class EmbeddingBatcher:
+    """Collects face crops from concurrent requests for up to max_wait_ms or max_batch_size items,
+    embeds them in one batched forward pass on the executor and scatters the vectors back to the
+    waiting callers. embed_fn maps a stacked (N, H, W, C) array of faces to N embeddings"""
+
+    def __init__(self, embed_fn: Callable[[np.ndarray], Any], executor: InferenceExecutor, max_batch_size: int, max_wait_ms: float):
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[np.ndarray, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.last_batch_size = 0
+
+    async def embed(self, faces: List[np.ndarray]) -> List[np.ndarray]:
+        if not faces:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for face in faces:
+            future = loop.create_future()
+            self._pending.append((face, future))
+            futures.append(future)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[np.ndarray, asyncio.Future]]):
+        # Callers that went away while queued don't need a slot in the batch
+        batch = [(face, future) for face, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            embeddings = await self.executor.run(self.embed_fn, np.stack([face for face, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.last_batch_size = len(batch)
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "last_batch_size": self.last_batch_size,
+            "pending": len(self._pending),
+        }
+
+async def run_stages(**stages) -> Dict[str, Any]:
+    """Run independent pipeline stages concurrently and merge their results by name.
+    If any stage fails, the remaining stages are cancelled and the error is re-raised."""
+    tasks = {name: asyncio.create_task(coro) for name, coro in stages.items()}
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,79 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Prometheus metrics: per-stage latency histograms and error counters, request latency and
+# in-flight gauges per endpoint, model warm-up time. Served by each service's /metrics.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_SECONDS = Histogram("zkyc_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS)
+STAGE_ERRORS = Counter("zkyc_stage_errors_total", "Pipeline stage failures", ["stage"])
+REQUEST_SECONDS = Histogram("zkyc_request_seconds", "Request latency after admission", ["endpoint"], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("zkyc_requests_in_flight", "Admitted requests being processed", ["endpoint"])
+MODEL_LOAD_SECONDS = Gauge("zkyc_model_load_seconds", "Duration of the startup model warm-up")
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a pipeline stage into zkyc_stage_seconds and count its failures; also usable as a decorator"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and in-flight requests for the admission-controlled paths,
+    plus the time taken to receive the upload body as the "upload" stage
+    """
+    
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = set(paths)
+    
+    async def __call__(self, scope, receive, send):
+        path = scope["path"] if scope["type"] == "http" else None
+        if path not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        body_received = False
+        
+        async def timed_receive():
+            nonlocal body_received
+            message = await receive()
+            if not body_received and message["type"] == "http.request" and not message.get("more_body", False):
+                body_received = True
+                STAGE_SECONDS.labels("upload").observe(time.perf_counter() - start)
+            return message
+        
+        in_flight = REQUESTS_IN_FLIGHT.labels(path)
+        in_flight.inc()
+        try:
+            await self.app(scope, timed_receive, send)
+        finally:
+            in_flight.dec()
+            REQUEST_SECONDS.labels(path).observe(time.perf_counter() - start)
+
+class AdmissionCollector:
+    """Exports the counters of a {endpoint name: AdmissionLimiter} mapping at scrape time"""
+    
+    def __init__(self, limiters):
+        self.limiters = limiters
+    
+    def collect(self):
+        queue_depth = GaugeMetricFamily("zkyc_admission_queue_depth", "Requests waiting for an admission slot", labels=["endpoint"])
+        wait = CounterMetricFamily("zkyc_admission_wait_seconds", "Time admitted requests spent waiting for a slot", labels=["endpoint"])
+        shed = CounterMetricFamily("zkyc_admission_shed", "Requests shed by admission control", labels=["endpoint", "reason"])
+        for name, limiter in self.limiters.items():
+            queue_depth.add_metric([name], limiter.waiting)
+            wait.add_metric([name], limiter.wait_seconds_total)
+            shed.add_metric([name, "queue_full"], limiter.shed_queue_full)
+            shed.add_metric([name, "timeout"], limiter.shed_timeout)
+        yield queue_depth
+        yield wait
+        yield shed
@@ -0,0 +1,126 @@
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from zkyc_common.metrics import observe_stage
+
+logger = logging.getLogger("uvicorn.error")
+
+def new_verification_id() -> str:
+    """Random, collision-free verification ID"""
+    return f"zkv_{uuid.uuid4().hex}"
+
+class VerificationLog:
+    """
+    Append-only store of verification records keyed by verification ID. append() only queues the
+    record; a writer thread commits queued records in batches. Records not yet committed are
+    served from memory, so a lookup right after a verification always finds it.
+    """
+    
+    def __init__(self, path: str, batch_size: int, flush_seconds: float, retention_seconds: float):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retention_seconds = retention_seconds
+        self.queue: "queue.Queue[Optional[Tuple[str, float, Dict[str, Any]]]]" = queue.Queue()
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.pending_lock = threading.Lock()
+        self.read_lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.writer: Optional[threading.Thread] = None
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS verifications (id TEXT PRIMARY KEY, created_at REAL NOT NULL, record BLOB NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS verifications_created_at ON verifications (created_at)")
+        return conn
+    
+    def open(self):
+        self.conn = self._connect()
+        self.writer = threading.Thread(target=self._run, name="verification-log", daemon=True)
+        self.writer.start()
+    
+    def close(self):
+        """Flush queued records and stop the writer"""
+        self.queue.put(None)
+        self.writer.join()
+        self.conn.close()
+    
+    def append(self, verification_id: str, record: Dict[str, Any]):
+        with self.pending_lock:
+            self.pending[verification_id] = record
+        self.queue.put((verification_id, time.time(), record))
+    
+    def get(self, verification_id: str) -> Optional[Dict[str, Any]]:
+        with self.pending_lock:
+            record = self.pending.get(verification_id)
+        if record is not None:
+            return record
+        with self.read_lock:
+            row = self.conn.execute("SELECT record FROM verifications WHERE id = ?", (verification_id,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+    
+    def _run(self):
+        conn = self._connect()
+        last_prune = 0.0
+        while True:
+            # Block for the first record, then gather more for up to flush_seconds
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_seconds
+            while item is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            records = [entry for entry in batch if entry is not None]
+            if records:
+                self._write(conn, records)
+            if len(records) < len(batch):
+                break
+            if self.retention_seconds > 0 and time.monotonic() - last_prune > 3600:
+                last_prune = time.monotonic()
+                with conn:
+                    conn.execute("DELETE FROM verifications WHERE created_at < ?", (time.time() - self.retention_seconds,))
+        conn.close()
+    
+    def _write(self, conn: sqlite3.Connection, records: List[Tuple[str, float, Dict[str, Any]]]):
+        try:
+            with observe_stage("log_write"), conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO verifications (id, created_at, record) VALUES (?, ?, ?)",
+                    [
+                        (verification_id, created_at, zlib.compress(json.dumps(record, ensure_ascii=False).encode("utf-8")))
+                        for verification_id, created_at, record in records
+                    ]
+                )
+            self.written += len(records)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(records)
+            logger.error(f"Verification log write failed, dropped {len(records)} records: {str(e)}")
+        with self.pending_lock:
+            for verification_id, _, _ in records:
+                self.pending.pop(verification_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed
+        }
@@ -0,0 +1,40 @@
+import hashlib
+import os
+
+WEIGHTS_MANIFEST = "weights.sha256"
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_weight_manifest(directory: str) -> None:
+    """Record the SHA-256 of every file in the weight bundle"""
+    entries = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, directory)
+            if relative != WEIGHTS_MANIFEST:
+                entries.append((relative, sha256_file(path)))
+    with open(os.path.join(directory, WEIGHTS_MANIFEST), "w") as f:
+        for relative, digest in sorted(entries):
+            f.write(f"{digest}  {relative}\n")
+
+def verify_weight_bundle(directory: str) -> None:
+    """Check every file listed in the bundle manifest against its SHA-256"""
+    manifest_path = os.path.join(directory, WEIGHTS_MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise RuntimeError(f"Weight manifest not found: {manifest_path}")
+    with open(manifest_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            expected, relative = line.rstrip("\n").split("  ", 1)
+            path = os.path.join(directory, relative)
+            if not os.path.exists(path):
+                raise RuntimeError(f"Missing weight file: {relative}")
+            if sha256_file(path) != expected:
+                raise RuntimeError(f"Checksum mismatch for weight file: {relative}")